@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+Cout Python d'un step et d'un reset de DoubleBebop2Env-v0, sans ROS master ni Gazebo (rospy remplacé par fake_rospy).
+
+    python benchmark_env_overhead.py --step_mode LOCKSTEP --reset_mode TELEPORT --steps 5000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from openai_ros import fake_rospy
+world = fake_rospy.install()
+
+from openai_ros.task_envs.bebop2 import double_bebop2_task
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--step_mode", default="REALTIME", choices=["REALTIME", "LOCKSTEP"])
+    parser.add_argument("--reset_mode", default="TAKEOFF", choices=["TAKEOFF", "TELEPORT", "SNAPSHOT"])
+    parser.add_argument("--steps", type=int, default=5000)
+    parser.add_argument("--resets", type=int, default=50)
+    args = parser.parse_args()
+
+    # Pas de roslaunch : la simulation est fake_rospy.world
+    double_bebop2_task.ROSLauncher = lambda **kwargs: None
+    env = double_bebop2_task.DoubleBebop2TaskEnv(step_mode=args.step_mode, reset_mode=args.reset_mode, profile=True)
+
+    start = time.perf_counter()
+    for _ in range(args.resets):
+        env.reset()
+    reset_time = (time.perf_counter() - start) / args.resets
+
+    # Les drones restent en vol stationnaire, les episodes ne se finissent pas
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        env.step(np.zeros(3))
+    step_time = (time.perf_counter() - start) / args.steps
+
+    print(f"reset : {1e6 * reset_time:.0f} us, step : {1e6 * step_time:.0f} us ({1 / step_time:.0f} steps/s)")
+    for timer in (env.reset_timer, env.step_timer):
+        print(f"{timer.name} (p50 / p95 / p99 us)")
+        for phase, (p50, p95, p99) in timer.summary().items():
+            print(f"  {phase:<20} {1000 * p50:8.1f} {1000 * p95:8.1f} {1000 * p99:8.1f}")
+    print("service calls :", world.calls, f"({env.gazebo.saved_calls} redundant pause/unpause calls skipped)")
+    print("service latency (calls / failures / connections, p50 / p95 / p99 us)")
+    for name, (calls, failures, connections, (p50, p95, p99)) in env.gazebo.service_stats().items():
+        print(f"  {name:<35} {calls:6d} {failures:3d} {connections:3d} {1000 * p50:8.1f} {1000 * p95:8.1f} {1000 * p99:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
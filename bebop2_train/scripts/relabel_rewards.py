@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+Recalcule hors ligne les rewards et les fins d'episode de transitions enregistrées, pour un autre reward system
+de config/double_bebop2_rewards.yaml, sans relancer Gazebo.
+
+    python relabel_rewards.py buffer.npz --reward_system reward_system2 --out buffer_system2.npz
+
+Le fichier est celui de ReplayBuffer.save (sac(..., buffer_path=..., state_dim=STATE_SIZE)) ou tout .npz avec les
+memes clés : state2 (info["state"] de DoubleBebop2Env-v0), rews et done. Les observations des rewards sont
+reconstruites depuis les odometries de state2 (double_bebop2_common.full_observation) : les reward systems qui
+utilisent vitesses et angles marchent aussi sur des transitions enregistrées avec observation="DISTANCE".
+Le fichier ecrit a les memes clés, rews et done remplacés, et peut servir a demarrer un entrainement
+(buffer_path de sac).
+
+Un buffer enregistré avec sac(..., normalize=True) contient des rewards normalisées : il faut donner les statistiques
+du modele (--normalize Models_sac/<episode>/normalize.npz) pour que les nouvelles rewards soient a la meme echelle,
+sinon le fichier est refusé.
+
+Les transitions doivent venir d'un env avec action_repeat=1 : avec k > 1, la reward d'un step est une somme
+sur k periodes dont seul le dernier etat est gardé.
+"""
+import argparse
+
+import numpy as np
+
+from openai_ros.normalize_env import load_stats
+from openai_ros.task_envs.bebop2 import double_bebop2_common
+from openai_ros.task_envs.bebop2.double_bebop2_common import ALTITUDE, MAX_STEP, STATE_SIZE
+
+L, R = 0, 1
+
+
+def relabel(data, engine, max_ep_len=MAX_STEP):
+    """
+    Rewards et dones de toutes les transitions de data en une evaluation vectorisée.
+    Comme dans sac(), done est faux pour les transitions qui atteignent max_ep_len.
+    """
+    if data["state2"].shape[-1] != STATE_SIZE:
+        raise ValueError(f"state2 has {data['state2'].shape[-1]} columns, expected {STATE_SIZE} (info['state'])")
+
+    odom, number_step = double_bebop2_common.unpack_state(data["state2"])
+    observations = double_bebop2_common.full_observation(odom)
+    rewards, dones = engine.evaluate(observations, odom[:, L, ALTITUDE], odom[:, R, ALTITUDE], number_step)
+    dones &= number_step < max_ep_len
+    return rewards.astype(np.float32), dones.astype(np.float32)
+
+
+def normalize_rewards(rewards, path, clip_reward=10.0):
+    """Rewards a l'echelle de NormalizeEnv.normalize_reward, avec les statistiques de normalize.npz"""
+    _, ret_rms = load_stats(path)
+    return np.clip(rewards / ret_rms.std, -clip_reward, clip_reward).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", help=".npz de transitions (ReplayBuffer.save)")
+    parser.add_argument("--reward_system", default="reward_system0bis",
+                        choices=double_bebop2_common.RewardEngine.available())
+    parser.add_argument("--out", default=None, help=".npz ecrit avec les nouvelles rewards (rien si absent)")
+    parser.add_argument("--max_ep_len", type=int, default=MAX_STEP)
+    parser.add_argument("--normalize", default=None,
+                        help="normalize.npz du modele, obligatoire pour un buffer enregistré avec normalize=True")
+    parser.add_argument("--clip_reward", type=float, default=10.0, help="clip_reward de NormalizeEnv")
+    args = parser.parse_args()
+
+    data = dict(np.load(args.path))
+    normalized = "normalized" in data and bool(data["normalized"])
+    if normalized != (args.normalize is not None):
+        parser.error("--normalize is required for buffers saved with normalize=True, and only for them")
+
+    engine = double_bebop2_common.RewardEngine(args.reward_system)
+    rewards, dones = relabel(data, engine, args.max_ep_len)
+    if normalized:
+        rewards = normalize_rewards(rewards, args.normalize, args.clip_reward)
+
+    print(f"{len(rewards)} transitions, {args.reward_system}")
+    print(f"  reward : mean {data['rews'].mean():.3f} -> {rewards.mean():.3f}")
+    print(f"  done   : {int(data['done'].sum())} -> {int(dones.sum())} "
+          f"({int((dones != data['done']).sum())} transitions changed)")
+
+    if args.out is not None:
+        data["rews"], data["done"] = rewards, dones
+        np.savez(args.out, **data)
+        print(f"  written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
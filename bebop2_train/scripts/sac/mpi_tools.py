@@ -75,6 +75,14 @@ def mpi_sum(x):
     return mpi_op(x, MPI.SUM)
 
 
+def mpi_sum64(x):
+    """Sum a scalar or array over MPI processes, in float64 (mpi_sum rounds to float32)."""
+    x = np.asarray(x, dtype=np.float64)
+    buff = np.zeros_like(x)
+    allreduce(x, buff, op=MPI.SUM)
+    return buff
+
+
 def mpi_avg(x):
     """Average a scalar or vector over MPI processes."""
     return mpi_sum(x) / num_procs()
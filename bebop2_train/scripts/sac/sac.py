@@ -10,28 +10,73 @@ import tensorflow as tf
 
 import core
 import logx
+import mpi_tools
+from openai_ros.async_step_env import AsyncStepEnv
+from openai_ros.frame_stack_env import FrameStackEnv
+from openai_ros.normalize_env import NormalizeEnv
+
+
+def check_normalized(data, normalized, path):
+    """Refuses transitions whose rewards and observations are not on the scale of the buffer."""
+    saved = "normalized" in data and bool(data["normalized"])
+    if saved != normalized:
+        raise ValueError(f"{path} was saved with normalized={saved}, the replay buffer has normalized={normalized}")
 
 
 class ReplayBuffer:
-    """A simple FIFO experience replay buffer for SAC agents."""
+    """A simple FIFO experience replay buffer for SAC agents.
 
-    def __init__(self, obs_dim, act_dim, size):
+    With state_dim > 0, the full state after each transition (info["state"]
+    of the env) is kept too, so that rewards can be recomputed offline
+    (relabel_rewards.py). normalized tells whether observations and rewards
+    come from NormalizeEnv; it is saved with the transitions and only files
+    with the same value can be loaded.
+    """
+
+    def __init__(self, obs_dim, act_dim, size, state_dim=0, normalized=False):
         self.obs1_buf = np.zeros([size, obs_dim], dtype=np.float32)
         self.obs2_buf = np.zeros([size, obs_dim], dtype=np.float32)
         self.acts_buf = np.zeros([size, act_dim], dtype=np.float32)
         self.rews_buf = np.zeros(size, dtype=np.float32)
         self.done_buf = np.zeros(size, dtype=np.float32)
+        self.state2_buf = np.zeros([size, state_dim], dtype=np.float64)
         self.ptr, self.size, self.max_size = 0, 0, size
+        self.normalized = normalized
 
-    def store(self, obs, act, rew, next_obs, done):
+    def store(self, obs, act, rew, next_obs, done, next_state=None):
         self.obs1_buf[self.ptr] = obs
         self.obs2_buf[self.ptr] = next_obs
         self.acts_buf[self.ptr] = act
         self.rews_buf[self.ptr] = rew
         self.done_buf[self.ptr] = done
+        if next_state is not None and self.state2_buf.shape[1]:
+            self.state2_buf[self.ptr] = next_state
         self.ptr = (self.ptr + 1) % self.max_size
         self.size = min(self.size + 1, self.max_size)
 
+    def save(self, path):
+        """Saves the stored transitions, oldest first, to a .npz file."""
+        order = np.roll(np.arange(self.size), -self.ptr) if self.size == self.max_size else np.arange(self.size)
+        np.savez(path, obs1=self.obs1_buf[order], obs2=self.obs2_buf[order], acts=self.acts_buf[order],
+                 rews=self.rews_buf[order], done=self.done_buf[order], state2=self.state2_buf[order],
+                 normalized=self.normalized)
+
+    def load(self, path):
+        """Appends the transitions of a .npz file written by save() (or relabel_rewards.py)."""
+        data = np.load(path)
+        check_normalized(data, self.normalized, path)
+        n = min(len(data["rews"]), self.max_size)
+        idxs = (self.ptr + np.arange(n)) % self.max_size
+        self.obs1_buf[idxs] = data["obs1"][-n:]
+        self.obs2_buf[idxs] = data["obs2"][-n:]
+        self.acts_buf[idxs] = data["acts"][-n:]
+        self.rews_buf[idxs] = data["rews"][-n:]
+        self.done_buf[idxs] = data["done"][-n:]
+        if "state2" in data and data["state2"].shape[1] == self.state2_buf.shape[1]:
+            self.state2_buf[idxs] = data["state2"][-n:]
+        self.ptr = (self.ptr + n) % self.max_size
+        self.size = min(self.size + n, self.max_size)
+
     def sample_batch(self, batch_size=32):
         idxs = np.random.randint(0, self.size, size=batch_size)
         return dict(obs1=tf.convert_to_tensor(self.obs1_buf[idxs]),
@@ -41,12 +86,104 @@ class ReplayBuffer:
                     done=tf.convert_to_tensor(self.done_buf[idxs]))
 
 
+class FrameStackReplayBuffer:
+    """A replay buffer for FrameStackEnv observations that stores single frames.
+
+    Each transition keeps the indices of its k + 1 frames (the k frames of
+    obs followed by the new frame of next_obs) and the stacks are rebuilt in
+    sample_batch, so memory grows with k only through the index array.
+    An episode must start with the observation of FrameStackEnv.reset (the
+    first frame repeated k times); it is detected when obs is not the
+    next_obs of the previous transition. normalized is as in ReplayBuffer.
+    """
+
+    def __init__(self, frame_dim, act_dim, size, k, state_dim=0, normalized=False):
+        # At most two new frames per transition, a stack reaches k transitions
+        # back, and load() writes the k frames of its first stack.
+        self.frame_buf = np.zeros([2 * (size + k) + k, frame_dim], dtype=np.float32)
+        self.idx_buf = np.zeros([size, k + 1], dtype=np.int32)
+        self.acts_buf = np.zeros([size, act_dim], dtype=np.float32)
+        self.rews_buf = np.zeros(size, dtype=np.float32)
+        self.done_buf = np.zeros(size, dtype=np.float32)
+        self.state2_buf = np.zeros([size, state_dim], dtype=np.float64)
+        self.ptr, self.size, self.max_size = 0, 0, size
+        self.frame_ptr, self.k = 0, k
+        self.stack = None
+        self.normalized = normalized
+
+    def _add_frame(self, frame):
+        i = self.frame_ptr
+        self.frame_buf[i] = frame
+        self.frame_ptr = (i + 1) % len(self.frame_buf)
+        return i
+
+    def store(self, obs, act, rew, next_obs, done, next_state=None):
+        frames = np.asarray(obs, dtype=np.float32).reshape(self.k, -1)
+        if self.stack is None or not np.array_equal(self.frame_buf[self.stack], frames):
+            if not np.all(frames == frames[-1]):
+                raise ValueError("an episode must start with the first frame repeated k times")
+            self.stack = np.full(self.k, self._add_frame(frames[-1]))
+        self.idx_buf[self.ptr, :-1] = self.stack
+        self.idx_buf[self.ptr, -1] = self._add_frame(np.asarray(next_obs)[-frames.shape[1]:])
+        self.stack = self.idx_buf[self.ptr, 1:].copy()
+
+        self.acts_buf[self.ptr] = act
+        self.rews_buf[self.ptr] = rew
+        self.done_buf[self.ptr] = done
+        if next_state is not None and self.state2_buf.shape[1]:
+            self.state2_buf[self.ptr] = next_state
+        self.ptr = (self.ptr + 1) % self.max_size
+        self.size = min(self.size + 1, self.max_size)
+
+    def stacks(self, idxs):
+        """Rebuilds the (obs1, obs2) stacks of the transitions idxs."""
+        frames = self.frame_buf[self.idx_buf[idxs]]
+        return frames[:, :-1].reshape(len(idxs), -1), frames[:, 1:].reshape(len(idxs), -1)
+
+    def save(self, path):
+        """Saves the stored transitions, oldest first, with the same keys as ReplayBuffer.save."""
+        order = np.roll(np.arange(self.size), -self.ptr) if self.size == self.max_size else np.arange(self.size)
+        obs1, obs2 = self.stacks(order)
+        np.savez(path, obs1=obs1, obs2=obs2, acts=self.acts_buf[order],
+                 rews=self.rews_buf[order], done=self.done_buf[order], state2=self.state2_buf[order],
+                 normalized=self.normalized)
+
+    def load(self, path):
+        """Appends the transitions of a .npz file written by save() (or relabel_rewards.py)."""
+        data = np.load(path)
+        check_normalized(data, self.normalized, path)
+        n = min(len(data["rews"]), self.max_size)
+        obs1, obs2, acts = data["obs1"][-n:], data["obs2"][-n:], data["acts"][-n:]
+        rews, done = data["rews"][-n:], data["done"][-n:]
+        keep_state = "state2" in data and data["state2"].shape[1] == self.state2_buf.shape[1]
+        state2 = data["state2"][-n:] if keep_state else [None] * n
+        # Transitions are replayed in order so that the frames of a trajectory
+        # are shared. The first one can be in the middle of an episode (FIFO
+        # wrapped, or cut by [-n:]), so all the frames of its obs are written.
+        self.stack = None
+        if n > 0:
+            frames = np.asarray(obs1[0], dtype=np.float32).reshape(self.k, -1)
+            self.stack = np.array([self._add_frame(frame) for frame in frames])
+        for i in range(n):
+            self.store(obs1[i], acts[i], rews[i], obs2[i], done[i], state2[i])
+
+    def sample_batch(self, batch_size=32):
+        idxs = np.random.randint(0, self.size, size=batch_size)
+        obs1, obs2 = self.stacks(idxs)
+        return dict(obs1=tf.convert_to_tensor(obs1),
+                    obs2=tf.convert_to_tensor(obs2),
+                    acts=tf.convert_to_tensor(self.acts_buf[idxs]),
+                    rews=tf.convert_to_tensor(self.rews_buf[idxs]),
+                    done=tf.convert_to_tensor(self.done_buf[idxs]))
+
+
 def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
         total_steps=1_000_000, log_every=10_000, replay_size=1_000_000,
         gamma=0.99, polyak=0.995, lr=0.001, alpha=0.2, batch_size=256,
         start_steps=10_000, update_after=1000, update_every=50,
         num_test_episodes=10, max_ep_len=1000, logger_kwargs=None,
-        save_freq=int(1e4), save_path=None,load_path=None,  episode = 0):
+        save_freq=int(1e4), save_path=None,load_path=None,  episode = 0, pipeline=False,
+        buffer_path=None, state_dim=0, normalize=False, frame_stack=1):
     """Soft Actor-Critic (SAC)
 
     Args:
@@ -138,6 +275,33 @@ def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
         save_path (str): The path specifying where to save the trained actor
             model (note: path needs to point to a directory). Setting the value
             to None turns off the saving.
+
+        pipeline (bool): Step the environment in a background thread. While
+            the simulator advances step t, the action for step t+1 is computed
+            from the current observation (one step of action latency) and one
+            gradient update is done per env step instead of update_every
+            updates every update_every steps.
+
+        buffer_path (str): .npz file of transitions. If it exists, the replay
+            buffer starts with them (warm start, e.g. after relabel_rewards.py),
+            and the replay buffer is saved there with the model.
+
+        state_dim (int): Size of info["state"] kept with each transition
+            (double_bebop2_common.STATE_SIZE for DoubleBebop2Env-v0), 0 to
+            keep no state.
+
+        normalize (bool): Normalize observations and rewards with running
+            statistics (NormalizeEnv). The statistics are saved and loaded
+            with the weights (normalize.npz) and frozen while testing. The
+            replay buffer stores the normalized values, so buffer_path must
+            then be a buffer saved with normalize=True. Under MPI, the
+            statistics of all workers are merged at the end of each epoch
+            (every log_every steps).
+
+        frame_stack (int): Number of past observations given to the agent
+            (FrameStackEnv). With more than one, the replay buffer keeps
+            single frames and rebuilds the stacks when sampling
+            (FrameStackReplayBuffer).
     """
 
     # config = locals()
@@ -151,6 +315,13 @@ def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
     np.random.seed(seed)
 
     env = env_fn()
+    normalizer = None
+    if normalize:
+        env = normalizer = NormalizeEnv(env)
+    if frame_stack > 1:
+        env = FrameStackEnv(env, frame_stack)
+    if pipeline:
+        env = AsyncStepEnv(env)
     # test_env = env_fn()
 
     obs_dim = env.observation_space.shape[0]
@@ -164,8 +335,17 @@ def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
     ac_kwargs['observation_space'] = env.observation_space
 
     # Experience buffer.
-    replay_buffer = ReplayBuffer(obs_dim=obs_dim, act_dim=act_dim,
-                                 size=replay_size)
+    if frame_stack > 1:
+        replay_buffer = FrameStackReplayBuffer(frame_dim=obs_dim // frame_stack, act_dim=act_dim,
+                                               size=replay_size, k=frame_stack, state_dim=state_dim,
+                                               normalized=normalize)
+    else:
+        replay_buffer = ReplayBuffer(obs_dim=obs_dim, act_dim=act_dim,
+                                     size=replay_size, state_dim=state_dim,
+                                     normalized=normalize)
+    if buffer_path is not None and os.path.isfile(buffer_path):
+        replay_buffer.load(buffer_path)
+        print(f"{replay_buffer.size} transitions loaded from {buffer_path}")
 
     # Build an actor and critics.
     actor, critic = actor_critic(**ac_kwargs)
@@ -202,6 +382,8 @@ def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
         critic2.load_weights(load_path + "/critic2.h5")
         target_critic1.load_weights(load_path + "/target_critic1.h5")
         target_critic2.load_weights(load_path + "/target_critic2.h5")
+        if normalizer is not None and os.path.isfile(load_path + "/normalize.npz"):
+            normalizer.load(load_path + "/normalize.npz")
         print("WEIHGTS LOADED")
 
     critic_variables = critic1.trainable_variables + critic2.trainable_variables
@@ -268,35 +450,55 @@ def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
 
     def test_agent():
         print("================TESTING=================")
+        if normalizer is not None:
+            normalizer.freeze()
         for _ in range(num_test_episodes):
             o, d, ep_ret, ep_len = env.reset(), False, 0, 0
             while not (d or (ep_len == max_ep_len)):
                 # Take deterministic actions at test time.
-                o, r, d, _ = env.step(
+                o, r, d, info = env.step(
                     get_action(tf.convert_to_tensor(o), tf.constant(True)))
-                ep_ret += r
+                ep_ret += info.get("raw_reward", r)
                 ep_len += 1
             print(f"Score : {ep_ret}, step : {ep_len}")
+        if normalizer is not None:
+            normalizer.unfreeze()
             # logger.store(TestEpRet=ep_ret, TestEpLen=ep_len)
 
+    def select_action(o, t):
+        # Until start_steps have elapsed, randomly sample actions
+        # from a uniform distribution for better exploration. Afterwards,
+        # use the learned policy.
+        if t > start_steps:
+            return get_action(tf.convert_to_tensor(o))
+        return env.action_space.sample()
+
     start_time = time.time()
     o, ep_ret, ep_len = env.reset(), 0, 0
+    # Pipeline : action deja calculée pour le pas suivant
+    next_a = None
 
     # Main loop: collect experience in env and update/log each epoch.
     for t in range(total_steps):
         iter_time = time.time()
 
-        # Until start_steps have elapsed, randomly sample actions
-        # from a uniform distribution for better exploration. Afterwards,
-        # use the learned policy.
-        if t > start_steps:
-            a = get_action(tf.convert_to_tensor(o))
+        if next_a is None:
+            a = select_action(o, t)
         else:
-            a = env.action_space.sample()
+            a = next_a
 
         # Step the environment.
-        o2, r, d, _ = env.step(a)
-        ep_ret += r
+        if pipeline:
+            env.step_async(a)
+            # Pendant que la simulation avance : action du pas suivant et une mise a jour
+            next_a = select_action(o, t + 1)
+            if t >= update_after:
+                results = learn_on_batch(**replay_buffer.sample_batch(batch_size))
+            o2, r, d, info = env.step_wait()
+        else:
+            o2, r, d, info = env.step(a)
+        # Score dans l'echelle de l'env meme avec normalize
+        ep_ret += info.get("raw_reward", r)
         ep_len += 1
 
         # Ignore the "done" signal if it comes from hitting the time
@@ -305,7 +507,7 @@ def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
         d = False if ep_len == max_ep_len else d
 
         # Store experience to replay buffer.
-        replay_buffer.store(o, a, r, o2, d)
+        replay_buffer.store(o, a, r, o2, d, info.get("state"))
 
         # Super critical, easy to overlook step: make sure to update
         # most recent observation!
@@ -318,6 +520,7 @@ def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
             average = sum(scores[-50:])/len(scores[-50:])
             print(f"epsiode : {episode} : score = {ep_ret}, step = {ep_len}, average = {average:.2f}, random action : {t<= start_steps}")
             o, ep_ret, ep_len = env.reset(), 0, 0
+            next_a = None
             episode += 1
 
 
@@ -330,11 +533,16 @@ def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
             tg2_tuple   = ("target_critic2", target_critic2)
             test_agent()
 
-            save(scores, f"Models_sac/{episode}", actor_tuple, critic_tuple, critic1_tuple, critic2_tuple, tg1_tuple, tg2_tuple)
+            save(scores, f"Models_sac/{episode}", actor_tuple, critic_tuple, critic1_tuple, critic2_tuple, tg1_tuple, tg2_tuple,
+                 normalizer=normalizer)
+            orig_episod = episode
+            # test_agent a joué sur le meme env (et ecrasé les frames de FrameStackEnv) : nouvel episode d'entrainement
+            o, ep_ret, ep_len = env.reset(), 0, 0
+            next_a = None
 
 
         # Update handling.
-        if t >= update_after and t % update_every == 0:
+        if not pipeline and t >= update_after and t % update_every == 0:
             for _ in range(update_every):
                 batch = replay_buffer.sample_batch(batch_size)
                 results = learn_on_batch(**batch)
@@ -348,6 +556,12 @@ def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
 
         # logger.store(StepsPerSecond=(1 / (time.time() - iter_time)))
 
+        # End of epoch: all MPI workers go on with the same normalization
+        # statistics.
+        if normalizer is not None and (((t + 1) % log_every == 0) or (t + 1 == total_steps)):
+            normalizer.obs_rms.sync(mpi_tools.mpi_sum64)
+            normalizer.ret_rms.sync(mpi_tools.mpi_sum64)
+
         # End of epoch wrap-up.
         # if ((t + 1) % log_every == 0) or (t + 1 == total_steps):
             # Test the performance of the deterministic version of the agent.
@@ -375,14 +589,18 @@ def sac(env_fn, actor_critic=core.mlp_actor_critic, ac_kwargs=None, seed=0,
         if ((t + 1) % save_freq == 0) or (t + 1 == total_steps):
             if save_path is not None:
                 tf.keras.models.save_model(actor, save_path)
+            if buffer_path is not None:
+                replay_buffer.save(buffer_path)
 
 # def save(actor, critic, critic1, critic2, target_critic1, target_critic2):
-def save(scores,folder = "Models_sac", *models):
+def save(scores,folder = "Models_sac", *models, normalizer=None):
     path  = f"/home/huss/.ros/{folder}"
     if not os.path.isdir(path):
         os.mkdir(path)
     
     np.save(path + '/score.npy', scores)
+    if normalizer is not None:
+        normalizer.save(path + '/normalize.npz')
 
     for m in models:
         try:
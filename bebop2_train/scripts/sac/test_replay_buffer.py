@@ -0,0 +1,85 @@
+"""Save/load tests for the SAC replay buffers."""
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+try:
+    import sac
+except ImportError as e:
+    raise unittest.SkipTest(f"sac dependencies not available: {e}")
+
+
+def stacked_transitions(n, k, frame_dim, seed=0):
+    """n transitions of FrameStackEnv-like observations (first frame repeated
+    k times at each episode start), built by plain concatenation."""
+    rng = np.random.default_rng(seed)
+    transitions = []
+    frames = [rng.standard_normal(frame_dim)] * k
+    for _ in range(n):
+        obs = np.concatenate(frames)
+        frames = frames[1:] + [rng.standard_normal(frame_dim)]
+        done = rng.random() < 0.1
+        transitions.append((obs, rng.standard_normal(2), rng.standard_normal(), np.concatenate(frames), done))
+        if done:
+            frames = [rng.standard_normal(frame_dim)] * k
+    return transitions
+
+
+class FrameStackReplayBufferTest(unittest.TestCase):
+    k, frame_dim, size = 4, 3, 50
+
+    def fill(self, n):
+        buffer = sac.FrameStackReplayBuffer(self.frame_dim, 2, self.size, self.k)
+        reference = sac.ReplayBuffer(self.k * self.frame_dim, 2, self.size)
+        for transition in stacked_transitions(n, self.k, self.frame_dim):
+            buffer.store(*transition)
+            reference.store(*transition)
+        return buffer, reference
+
+    def assert_same_transitions(self, buffer, reference):
+        obs1, obs2 = buffer.stacks(np.arange(buffer.size))
+        np.testing.assert_allclose(obs1, reference.obs1_buf[:buffer.size], rtol=1e-6)
+        np.testing.assert_allclose(obs2, reference.obs2_buf[:buffer.size], rtol=1e-6)
+        np.testing.assert_array_equal(buffer.rews_buf, reference.rews_buf)
+
+    def test_stacks_match_concatenation(self):
+        buffer, reference = self.fill(3 * self.size)
+        self.assert_same_transitions(buffer, reference)
+
+    def test_save_and_load_after_wrap(self):
+        # After wrapping, the oldest saved transition is in the middle of an episode.
+        buffer, reference = self.fill(3 * self.size + 7)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "buffer.npz")
+            buffer.save(path)
+            reference.save(os.path.join(tmp, "reference.npz"))
+
+            loaded = sac.FrameStackReplayBuffer(self.frame_dim, 2, self.size, self.k)
+            loaded.load(path)
+            expected = sac.ReplayBuffer(self.k * self.frame_dim, 2, self.size)
+            expected.load(os.path.join(tmp, "reference.npz"))
+            self.assertEqual(loaded.size, self.size)
+            self.assert_same_transitions(loaded, expected)
+
+            # A smaller buffer keeps the last transitions, cut in the middle of an episode too.
+            small = sac.FrameStackReplayBuffer(self.frame_dim, 2, self.size // 2 + 3, self.k)
+            small.load(path)
+            obs1, obs2 = small.stacks(np.arange(small.size))
+            data = np.load(path)
+            np.testing.assert_allclose(obs1, data["obs1"][-small.size:], rtol=1e-6)
+            np.testing.assert_allclose(obs2, data["obs2"][-small.size:], rtol=1e-6)
+
+    def test_load_refuses_other_normalization(self):
+        buffer, _ = self.fill(10)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "buffer.npz")
+            buffer.save(path)
+            normalized = sac.FrameStackReplayBuffer(self.frame_dim, 2, self.size, self.k, normalized=True)
+            with self.assertRaises(ValueError):
+                normalized.load(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
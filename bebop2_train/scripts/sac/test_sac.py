@@ -0,0 +1,58 @@
+"""Tests of the SAC training loop on a small gym env."""
+import unittest
+from unittest import mock
+
+import gym
+import numpy as np
+from gym import spaces
+
+try:
+    import sac
+except ImportError as e:
+    raise unittest.SkipTest(f"sac dependencies not available: {e}")
+
+
+class RandomEnv(gym.Env):
+    """Random observations, episodes of ep_len steps (old gym API, like the bebop2 envs)."""
+
+    def __init__(self, obs_dim=3, act_dim=2, ep_len=2):
+        self.observation_space = spaces.Box(-1.0, 1.0, (obs_dim,), dtype=np.float32)
+        self.action_space = spaces.Box(-1.0, 1.0, (act_dim,), dtype=np.float32)
+        self.ep_len = ep_len
+        self.steps = 0
+
+    def _obs(self):
+        return self.observation_space.sample()
+
+    def reset(self):
+        self.steps = 0
+        return self._obs()
+
+    def step(self, action):
+        self.steps += 1
+        return self._obs(), 1.0, self.steps == self.ep_len, {}
+
+
+class TestAgentDuringTrainingTest(unittest.TestCase):
+
+    def run_sac(self, episodes, **kwargs):
+        steps = 2 * episodes + 1
+        with mock.patch.object(sac, "save") as save:
+            # No update: only the env and replay buffer bookkeeping is exercised.
+            sac.sac(lambda: RandomEnv(), ac_kwargs=dict(hidden_sizes=(8,)), total_steps=steps,
+                    replay_size=steps, start_steps=steps, update_after=steps, num_test_episodes=1, max_ep_len=2,
+                    **kwargs)
+        return save
+
+    def test_frame_stack_training_goes_on_after_test_agent(self):
+        # test_agent overwrites the frames of FrameStackEnv after the 500th episode
+        save = self.run_sac(510, frame_stack=3)
+        self.assertEqual(save.call_count, 1)
+
+    def test_test_agent_runs_once_per_500_episodes(self):
+        save = self.run_sac(1010)
+        self.assertEqual([call.args[1] for call in save.call_args_list], ["Models_sac/500", "Models_sac/1000"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -26,6 +26,8 @@ import rospy
 import rospkg
 # import our training environment
 from openai_ros.task_envs.bebop2 import double_bebop2_task
+from openai_ros.async_step_env import AsyncStepEnv
+from openai_ros.normalize_env import NormalizeEnv
 
 gpus = tf.config.experimental.list_physical_devices('GPU')
 if len(gpus) > 0:
@@ -118,6 +120,11 @@ class PPOAgent:
         self.epochs = 10 # training epochs
         self.shuffle = True
         self.Training_batch = 512
+        # Pipeline : l'action du pas suivant est calculée pendant que la simulation avance (un pas de latence)
+        self.pipeline = False
+        # Observations et rewards normalisées par des statistiques courantes (sauvées avec les poids)
+        self.normalize = False
+        self.normalizer = None
         #self.optimizer = RMSprop
         self.optimizer = Adam
 
@@ -133,6 +140,7 @@ class PPOAgent:
         
         self.Actor_name = f"{self.env_name}_PPO_Actor.h5"
         self.Critic_name = f"{self.env_name}_PPO_Critic.h5"
+        self.Normalize_name = f"{self.env_name}_PPO_normalize.npz"
         # self.load() # uncomment to continue training from old weights
 
         # do not change bellow
@@ -246,10 +254,22 @@ class PPOAgent:
     def load(self):
         self.Actor.Actor.load_weights(self.Actor_name)
         self.Critic.Critic.load_weights(self.Critic_name)
+        self.load_normalizer(self.Normalize_name)
 
     def save(self):
         self.Actor.Actor.save_weights(self.Actor_name)
         self.Critic.Critic.save_weights(self.Critic_name)
+        if self.normalizer is not None:
+            self.normalizer.save(self.Normalize_name)
+
+    def load_normalizer(self, path):
+        """Si le modele a été entrainé sur des observations normalisées, l'env est enveloppé dans NormalizeEnv avec
+        ses statistiques"""
+        if not os.path.isfile(path):
+            return
+        if self.normalizer is None:
+            self.env = self.normalizer = NormalizeEnv(self.env)
+        self.normalizer.load(path)
 
     pylab.figure(figsize=(18, 9))
     pylab.subplots_adjust(left=0.05, right=0.98, top=0.96, bottom=0.06)
@@ -284,27 +304,47 @@ class PPOAgent:
     def run_batch(self):
         # Clearing the Screen
         os.system('clear')
+        if self.normalize and self.normalizer is None:
+            self.env = self.normalizer = NormalizeEnv(self.env)
+        if self.pipeline:
+            self.env = AsyncStepEnv(self.env)
         state = self.env.reset()
         state = np.reshape(state, [1, self.state_size[0]])
         done, score, SAVING = False, 0, ''
+        # Pipeline : (action, logp_t, observation qui a servi a la calculer) pour le pas suivant
+        pending = None
         while True:
             # Instantiate or reset games memory
             states, next_states, actions, rewards, dones, logp_ts = [], [], [], [], [], []
             for t in range(self.Training_batch):
                 # Actor picks an action
-                action, logp_t = self.act(state)
-                # Retrieve new state, reward, and whether the state is terminal
-                next_state, reward, done, _ = self.env.step(action[0]) 
+                if pending is None:
+                    action, logp_t = self.act(state)
+                    input_state = state
+                else:
+                    action, logp_t, input_state = pending
+
+                if self.pipeline:
+                    self.env.step_async(action[0])
+                    # Calculée pendant que la simulation avance, a partir de la derniere observation connue
+                    pending = self.act(state) + (state,)
+                    next_state, reward, done, info = self.env.step_wait()
+                    # L'agent apprend sur les observations qu'il a reellement utilisées
+                    next_input_state = pending[2]
+                else:
+                    # Retrieve new state, reward, and whether the state is terminal
+                    next_state, reward, done, info = self.env.step(action[0]) 
+                    next_input_state = np.reshape(next_state, [1, self.state_size[0]])
                 # Memorize (state, next_states, action, reward, done, logp_ts) for training
-                states.append(state)
-                next_states.append(np.reshape(next_state, [1, self.state_size[0]]))
+                states.append(input_state)
+                next_states.append(next_input_state)
                 actions.append(action)
                 rewards.append(reward)
                 dones.append(done)
                 logp_ts.append(logp_t[0])
                 # Update current state shape
                 state = np.reshape(next_state, [1, self.state_size[0]])
-                score += reward
+                score += info.get("raw_reward", reward)
                 if done:
                     self.episode += 1
                     average, SAVING = self.PlotModel(score, self.episode)
@@ -317,6 +357,7 @@ class PPOAgent:
                     
                     state, done, score, SAVING = self.env.reset(), False, 0, ''
                     state = np.reshape(state, [1, self.state_size[0]])
+                    pending = None
 
             self.replay(states, actions, rewards, dones, next_states, logp_ts)
             if self.episode >= self.EPISODES:
@@ -327,6 +368,7 @@ class PPOAgent:
     def load_from_path(self, path, start_episode = None):
         self.Actor.Actor.load_weights(path + "/Actor.h5")
         self.Critic.Critic.load_weights(path + "/Critic.h5")
+        self.load_normalizer(path + "/normalize.npz")
         print(f"Loaded {path}")
         if start_episode is not None : 
             self.episode = start_episode
@@ -348,16 +390,24 @@ class PPOAgent:
 
             self.Actor.Actor.save_weights(f"{folder}/{self.episode}/Actor.h5")
             self.Critic.Critic.save_weights(f"{folder}/{self.episode}/Critic.h5")
+            if self.normalizer is not None:
+                self.normalizer.save(f"{folder}/{self.episode}/normalize.npz")
             with open(f'{folder}/{self.episode}/data.txt', 'w') as f:
                 f.write(f"average : {average}")
 
     def force_save(self, folder = "Models"):
         self.Actor.Actor.save_weights(f"{folder}/Forced/Actor.h5")
         self.Critic.Critic.save_weights(f"{folder}/Forced/Critic.h5")
+        if self.normalizer is not None:
+            self.normalizer.save(f"{folder}/Forced/normalize.npz")
         print("file saved")
 
     def test(self, test_episodes = 100):#evaluate
         self.load()
+        if self.normalize and self.normalizer is None:
+            raise FileNotFoundError(f"{self.Normalize_name} not found, the model was trained with normalize")
+        if self.normalizer is not None:
+            self.normalizer.freeze()
         for e in range(101):
             state = self.env.reset()
             state = np.reshape(state, [1, self.state_size[0]])
@@ -366,9 +416,9 @@ class PPOAgent:
             while not done:
                 self.env.render()
                 action = self.Actor.predict(state)[0]
-                state, reward, done, _ = self.env.step(action)
+                state, reward, done, info = self.env.step(action)
                 state = np.reshape(state, [1, self.state_size[0]])
-                score += reward
+                score += info.get("raw_reward", reward)
                 if done:
                     average, SAVING = self.PlotModel(score, e, save=False)
                     print("episode: {}/{}, score: {}, average{}".format(e, test_episodes, score, average))
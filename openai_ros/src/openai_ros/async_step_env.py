@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+from concurrent.futures import ThreadPoolExecutor
+import gym
+
+
+class AsyncStepEnv(gym.Wrapper):
+    """
+    Execute env.step dans un thread pour que l'agent puisse calculer l'action suivante ou faire ses mises a jour
+    pendant que la simulation avance.
+
+    step_async(action) lance le pas, step_wait() attend son resultat. Un seul pas est en cours a la fois : l'action
+    appliquée a au plus un pas de retard sur l'observation.
+    """
+
+    def __init__(self, env):
+        super(AsyncStepEnv, self).__init__(env)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+
+    def step_async(self, action):
+        assert self._pending is None, "step_wait must be called before the next step_async"
+        self._pending = self._executor.submit(self.env.step, action)
+
+    def step_wait(self):
+        result = self._pending.result()
+        self._pending = None
+        return result
+
+    def step(self, action):
+        self.step_async(action)
+        return self.step_wait()
+
+    def reset(self, **kwargs):
+        assert self._pending is None, "reset called while a step is running"
+        return self.env.reset(**kwargs)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        return self.env.close()
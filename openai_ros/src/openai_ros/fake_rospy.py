@@ -0,0 +1,288 @@
+#!/usr/bin/env python
+"""
+Remplacant en memoire de rospy pour mesurer le cout Python des envs sans ROS master ni Gazebo.
+
+    from openai_ros import fake_rospy
+    world = fake_rospy.install()   # sys.modules["rospy"] = fake_rospy, a faire avant d'importer les envs
+    from openai_ros.task_envs.bebop2 import double_bebop2_task
+
+Seuls les appels utilisés par GazeboConnection, DoubleBebop2Env et la task sont fournis : Publisher, Subscriber,
+ServiceProxy, wait_for_message, wait_for_service, get_param, sleep, Rate, get_rostime et les logs. Les paquets de
+messages ROS (nav_msgs, geometry_msgs, gazebo_msgs...) restent nécessaires.
+
+Le temps simulé est deterministe : il n'avance que dans sleep (simulation non pausée) et dans le service
+/gazebo/step_world. A chaque periode de ScriptedOdometry, l'odometrie des deux drones est publiée et les callbacks
+des Subscriber sont appelés directement, dans le thread courant.
+"""
+import logging
+import sys
+import types
+
+import genpy
+from gazebo_msgs.msg import ODEPhysics
+from geometry_msgs.msg import Vector3
+from nav_msgs.msg import Odometry
+
+Time = genpy.Time
+Duration = genpy.Duration
+
+_logger = logging.getLogger("fake_rospy")
+logdebug = _logger.debug
+loginfo = _logger.info
+logwarn = _logger.warning
+logerr = _logger.error
+logfatal = _logger.critical
+
+
+class ROSException(Exception):
+    pass
+
+
+class ROSInterruptException(ROSException):
+    pass
+
+
+class ServiceException(ROSException):
+    pass
+
+
+class ScriptedOdometry(object):
+    """
+    Odometrie des drones donnée par trajectory(t) -> {topic: (position, velocity)}, publiée a `rate` Hz de temps
+    simulé. Par defaut, les deux drones sont en vol stationnaire a 1 m l'un de l'autre.
+    """
+
+    def __init__(self, trajectory=None, rate=100.0):
+        self.trajectory = trajectory or self.hover
+        self.period = 1.0 / rate
+
+    @staticmethod
+    def hover(t):
+        return {"/L_bebop2/ground_truth/odometry": ((0.0, -0.5, 1.0), (0.0, 0.0, 0.0)),
+                "/R_bebop2/ground_truth/odometry": ((0.0, 0.5, 1.0), (0.0, 0.0, 0.0))}
+
+    def messages(self, t):
+        messages = {}
+        for topic, (position, velocity) in self.trajectory(t).items():
+            msg = Odometry()
+            msg.header.stamp = Time.from_sec(t)
+            msg.pose.pose.position.x, msg.pose.pose.position.y, msg.pose.pose.position.z = position
+            msg.pose.pose.orientation.w = 1.0
+            msg.twist.twist.linear.x, msg.twist.twist.linear.y, msg.twist.twist.linear.z = velocity
+            messages[topic] = msg
+        return messages
+
+
+class FakeWorld(object):
+    """
+    Etat partagé par les objets de fake_rospy : temps simulé, pause, topics, services, parametres.
+    calls compte les appels de chaque service et publish_count les messages publiés sur chaque topic.
+    """
+
+    def __init__(self, odometry=None, time_step=0.01):
+        self.odometry = odometry or ScriptedOdometry()
+        self.time_step = time_step
+        self.max_update_rate = 1000.0
+        self.gravity = Vector3(0.0, 0.0, -9.81)
+        self.ode_config = ODEPhysics(sor_pgs_iters=50, sor_pgs_w=1.3, erp=0.2, max_contacts=20)
+        self.sim_time = 0.0
+        self.paused = False
+        self.shutdown = False
+        self.params = {}
+
+        self.subscribers = {}
+        self.latest = {}
+        self.publish_count = {}
+        self.calls = {}
+        self.services = {
+            "/gazebo/pause_physics": self._pause,
+            "/gazebo/unpause_physics": self._unpause,
+            "/gazebo/reset_world": self._reset_time,
+            "/gazebo/reset_simulation": self._reset_time,
+            "/gazebo/step_world": self._step_world,
+            "/gazebo/get_physics_properties": self._get_physics_properties,
+            "/gazebo/set_physics_properties": self._set_physics_properties,
+            "/gazebo/get_model_state": self._get_model_state,
+        }
+        self._odometry_index = 0
+
+    # Temps
+    def advance(self, duration):
+        """Avance le temps simulé de duration secondes en publiant l'odometrie a chaque periode"""
+        end = self.sim_time + duration
+        while self._odometry_index * self.odometry.period <= end:
+            self.sim_time = self._odometry_index * self.odometry.period
+            self.publish_odometry()
+            self._odometry_index += 1
+        self.sim_time = end
+
+    def publish_odometry(self):
+        for topic, msg in self.odometry.messages(self.sim_time).items():
+            self.deliver(topic, msg)
+
+    # Topics
+    def deliver(self, topic, msg):
+        self.latest[topic] = msg
+        self.publish_count[topic] = self.publish_count.get(topic, 0) + 1
+        for callback in self.subscribers.get(topic, ()):
+            callback(msg)
+
+    # Services
+    def call(self, name, *args):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        handler = self.services.get(name)
+        if handler is None:
+            return types.SimpleNamespace(success=True, status_message="")
+        return handler(*args)
+
+    def _pause(self, *args):
+        self.paused = True
+
+    def _unpause(self, *args):
+        self.paused = False
+
+    def _reset_time(self, *args):
+        self.sim_time = 0.0
+        self._odometry_index = 1
+        self.publish_odometry()
+
+    def _get_physics_properties(self, *args):
+        return types.SimpleNamespace(time_step=self.time_step, pause=self.paused, max_update_rate=self.max_update_rate,
+                                     gravity=self.gravity, ode_config=self.ode_config)
+
+    def _set_physics_properties(self, request):
+        self.time_step = request.time_step
+        self.max_update_rate = request.max_update_rate
+        self.gravity = request.gravity
+        self.ode_config = request.ode_config
+        return types.SimpleNamespace(success=True, status_message="")
+
+    def _get_model_state(self, model_name, relative_entity_name=""):
+        """Pose et vitesse tirées de la derniere odometrie publiée pour le modele"""
+        msg = self.latest.get(f"/{model_name}/ground_truth/odometry")
+        if msg is None:
+            return types.SimpleNamespace(success=False, status_message=f"no odometry for {model_name}")
+        return types.SimpleNamespace(success=True, status_message="", pose=msg.pose.pose, twist=msg.twist.twist)
+
+    def _step_world(self, iterations):
+        """Comme le plugin step_world : le monde est en pause apres les iterations"""
+        self.paused = True
+        self.advance(iterations * self.time_step)
+        return types.SimpleNamespace(success=True, world_iterations=iterations, sim_time=self.sim_time)
+
+
+world = FakeWorld()
+
+
+def install(new_world=None):
+    """Remplace rospy par ce module dans sys.modules et renvoie le FakeWorld utilisé"""
+    global world
+    if new_world is not None:
+        world = new_world
+    sys.modules["rospy"] = sys.modules[__name__]
+    return world
+
+
+# API rospy
+def init_node(name, *args, **kwargs):
+    pass
+
+
+def is_shutdown():
+    return world.shutdown
+
+
+def signal_shutdown(reason):
+    world.shutdown = True
+
+
+def get_param(name, default=None):
+    return world.params.get(name, default)
+
+
+def set_param(name, value):
+    world.params[name] = value
+
+
+def get_rostime():
+    return Time.from_sec(world.sim_time)
+
+
+def get_time():
+    return world.sim_time
+
+
+def sleep(duration):
+    """Avance le temps simulé. Simulation en pause, le temps ne bouge pas et sleep retourne tout de suite."""
+    if isinstance(duration, Duration):
+        duration = duration.to_sec()
+    if not world.paused:
+        world.advance(duration)
+
+
+class Rate(object):
+    def __init__(self, hz):
+        self.period = 1.0 / hz
+
+    def sleep(self):
+        sleep(self.period)
+
+
+def wait_for_service(service, timeout=None):
+    pass
+
+
+def wait_for_message(topic, topic_type, timeout=None):
+    if topic not in world.latest:
+        world.publish_odometry()
+    if topic not in world.latest:
+        raise ROSException(f"timeout exceeded while waiting for message on topic {topic}")
+    return world.latest[topic]
+
+
+class SubscribeListener(object):
+    def peer_subscribe(self, topic_name, topic_publish, peer_publish):
+        pass
+
+    def peer_unsubscribe(self, topic_name, num_peers):
+        pass
+
+
+class Publisher(object):
+    """Chaque topic est consideré comme ayant un abonné (le driver simulé)"""
+
+    def __init__(self, name, data_class, subscriber_listener=None, queue_size=None, **kwargs):
+        self.name = self.resolved_name = name
+        self.data_class = data_class
+        if subscriber_listener is not None:
+            subscriber_listener.peer_subscribe(name, None, None)
+
+    def get_num_connections(self):
+        return 1
+
+    def publish(self, msg):
+        world.deliver(self.name, msg)
+
+    def unregister(self):
+        pass
+
+
+class Subscriber(object):
+    def __init__(self, name, data_class, callback=None, **kwargs):
+        self.name = self.resolved_name = name
+        self.callback = callback
+        world.subscribers.setdefault(name, []).append(callback)
+
+    def unregister(self):
+        world.subscribers[self.name].remove(self.callback)
+
+
+class ServiceProxy(object):
+    def __init__(self, name, service_class, **kwargs):
+        self.resolved_name = name
+
+    def __call__(self, *args):
+        return world.call(self.resolved_name, *args)
+
+    def close(self):
+        pass
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+import gym
+import numpy as np
+from gym import spaces
+
+
+class FrameStackEnv(gym.Wrapper):
+    """
+    Observation = les k dernieres observations de l'env, concatenées (la plus ancienne en premier). Au reset la
+    premiere observation est repetée k fois.
+
+    Les frames sont ecrites une seule fois dans un buffer circulaire et l'observation rendue est une vue contigue
+    sur les k dernieres : pas de copie des k frames a chaque step. Quand le buffer est plein, les k - 1 dernieres
+    frames sont recopiées au debut (une copie tous les `history` steps environ).
+    Une observation rendue reste valide pendant `history` steps, puis est ecrasée : la copier pour la garder
+    plus longtemps (ReplayBuffer.store copie deja).
+    """
+
+    def __init__(self, env, k=4, history=64):
+        super(FrameStackEnv, self).__init__(env)
+        space = env.observation_space
+        assert len(space.shape) == 1, "FrameStackEnv expects 1-dim observations"
+        self.k = k
+        self.frame_dim = space.shape[0]
+        self.observation_space = spaces.Box(np.tile(space.low, k), np.tile(space.high, k), dtype=space.dtype)
+
+        # Taille minimale pour qu'une vue survive `history` ecritures, recopie du debut comprise
+        self._buffer = np.zeros((history + 2 * k, self.frame_dim), dtype=space.dtype)
+        self._pos = 0
+
+    def _view(self):
+        return self._buffer[self._pos - self.k:self._pos].reshape(-1)
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        if self._pos + self.k > len(self._buffer):
+            self._pos = 0
+        self._buffer[self._pos:self._pos + self.k] = obs
+        self._pos += self.k
+        return self._view()
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        if self._pos == len(self._buffer):
+            self._buffer[:self.k - 1] = self._buffer[self._pos - self.k + 1:self._pos]
+            self._pos = self.k - 1
+        self._buffer[self._pos] = obs
+        self._pos += 1
+        return self._view(), reward, done, info
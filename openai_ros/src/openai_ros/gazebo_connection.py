@@ -1,36 +1,112 @@
 #!/usr/bin/env python
 
+import math
+import time
 import rospy
 from std_srvs.srv import Empty
-from gazebo_msgs.msg import ODEPhysics
-from gazebo_msgs.srv import SetPhysicsProperties, SetPhysicsPropertiesRequest
+from gazebo_msgs.msg import ODEPhysics, ModelState
+from gazebo_msgs.srv import SetPhysicsProperties, SetPhysicsPropertiesRequest, GetPhysicsProperties, SetModelState, GetModelState
 from std_msgs.msg import Float64
 from geometry_msgs.msg import Vector3
+from .phase_timer import RollingWindow
+
+
+class PersistentService(object):
+    """
+    Persistent connection to a ROS service, used like a rospy.ServiceProxy.
+
+    The TCP connection is opened on the first call (after waiting for the service) and kept for the next ones.
+    When a call fails the connection is dropped and the exception is raised again : the caller's retry opens
+    a new connection. The latency of the last `window` successful calls is kept for service_stats().
+    """
+
+    def __init__(self, name, service_class, window=1000):
+        self.name = name
+        self.service_class = service_class
+        self.proxy = None
+
+        self.latency = RollingWindow(window)
+        self.calls = 0
+        self.failures = 0
+        self.connections = 0
+
+    def connect(self):
+        rospy.wait_for_service(self.name)
+        self.proxy = rospy.ServiceProxy(self.name, self.service_class, persistent=True)
+        self.connections += 1
+
+    def close(self):
+        if self.proxy is not None:
+            self.proxy.close()
+            self.proxy = None
+
+    def __call__(self, *args):
+        if self.proxy is None:
+            self.connect()
+
+        start = time.perf_counter()
+        try:
+            result = self.proxy(*args)
+        except rospy.ServiceException:
+            self.failures += 1
+            self.close()
+            raise
+
+        self.latency.add(time.perf_counter() - start)
+        self.calls += 1
+        return result
+
 
 class GazeboConnection():
 
     def __init__(self, start_init_physics_parameters, reset_world_or_sim, max_retry = 20):
 
         self._max_retry = max_retry
-        self.unpause = rospy.ServiceProxy('/gazebo/unpause_physics', Empty)
-        self.pause = rospy.ServiceProxy('/gazebo/pause_physics', Empty)
-        self.reset_simulation_proxy = rospy.ServiceProxy('/gazebo/reset_simulation', Empty)
-        self.reset_world_proxy = rospy.ServiceProxy('/gazebo/reset_world', Empty)
+        # Persistent connections, opened on the first call
+        self.unpause = PersistentService('/gazebo/unpause_physics', Empty)
+        self.pause = PersistentService('/gazebo/pause_physics', Empty)
+        self.reset_simulation_proxy = PersistentService('/gazebo/reset_simulation', Empty)
+        self.reset_world_proxy = PersistentService('/gazebo/reset_world', Empty)
+        self.set_model_state_proxy = PersistentService('/gazebo/set_model_state', SetModelState)
+        self.get_model_state_proxy = PersistentService('/gazebo/get_model_state', GetModelState)
+        self.get_physics = PersistentService('/gazebo/get_physics_properties', GetPhysicsProperties)
+        # Created on the first call to stepSim, the service comes from the rotors step_world plugin
+        self.step_world_proxy = None
 
         # Setup the Gravity Controle system
-        service_name = '/gazebo/set_physics_properties'
-        rospy.logdebug("Waiting for service " + str(service_name))
-        rospy.wait_for_service(service_name)
-        rospy.logdebug("Service Found " + str(service_name))
+        self.set_physics = PersistentService('/gazebo/set_physics_properties', SetPhysicsProperties)
 
-        self.set_physics = rospy.ServiceProxy(service_name, SetPhysicsProperties)
+        # Physics pause state as left by our own calls (None : unknown, read from the physics properties on the
+        # next pause/unpause). Calls that would not change it are skipped and counted in saved_calls.
+        self.paused = None
+        self.saved_calls = 0
+        # Base of the set_physics_properties requests : set by init_physics_parameters, or read from Gazebo by
+        # read_physics_parameters before the first change
+        self._ode_config = None
         self.start_init_physics_parameters = start_init_physics_parameters
         self.reset_world_or_sim = reset_world_or_sim
         self.init_values()
         # We always pause the simulation, important for legged robots learning
         self.pauseSim()
 
-    def pauseSim(self):
+    def sync_pause_state(self):
+        """
+        Reads the pause state from /gazebo/get_physics_properties, e.g. after something else paused or
+        unpaused Gazebo. Returns it.
+        """
+        self.paused = self.get_physics().pause
+        return self.paused
+
+    def pauseSim(self, force=False):
+        """
+        Pauses the physics. Does nothing if it is already paused, unless force is True.
+        """
+        if self.paused is None:
+            self.sync_pause_state()
+        if self.paused and not force:
+            self.saved_calls += 1
+            return
+
         rospy.logdebug("PAUSING service found...")
         paused_done = False
         counter = 0
@@ -40,6 +116,7 @@ class GazeboConnection():
                     rospy.logdebug("PAUSING service calling...")
                     self.pause()
                     paused_done = True
+                    self.paused = True
                     rospy.logdebug("PAUSING service calling...DONE")
                 except rospy.ServiceException as e:
                     counter += 1
@@ -51,7 +128,16 @@ class GazeboConnection():
 
         rospy.logdebug("PAUSING FINISH")
 
-    def unpauseSim(self):
+    def unpauseSim(self, force=False):
+        """
+        Unpauses the physics. Does nothing if it is already running, unless force is True.
+        """
+        if self.paused is None:
+            self.sync_pause_state()
+        if self.paused is False and not force:
+            self.saved_calls += 1
+            return
+
         rospy.logdebug("UNPAUSING service found...")
         unpaused_done = False
         counter = 0
@@ -61,6 +147,7 @@ class GazeboConnection():
                     rospy.logdebug("UNPAUSING service calling...")
                     self.unpause()
                     unpaused_done = True
+                    self.paused = False
                     rospy.logdebug("UNPAUSING service calling...DONE")
                 except rospy.ServiceException as e:
                     counter += 1
@@ -72,6 +159,90 @@ class GazeboConnection():
 
         rospy.logdebug("UNPAUSING FiNISH")
 
+    def stepSim(self, iterations):
+        """
+        Runs exactly `iterations` physics iterations on the paused world and only returns
+        once they are done. The world stays paused afterwards.
+        It needs the step_world plugin (librotors_gazebo_step_world_plugin.so) in the world file.
+        :return: simulation time in seconds after the iterations
+        """
+        if self.step_world_proxy is None:
+            from rotors_comm.srv import StepWorld
+            self.step_world_proxy = PersistentService('/gazebo/step_world', StepWorld)
+
+        counter = 0
+        while not rospy.is_shutdown():
+            if counter < self._max_retry:
+                try:
+                    result = self.step_world_proxy(iterations)
+                    # The plugin leaves the world paused, even if it was running before
+                    self.paused = True
+                    return result.sim_time
+                except rospy.ServiceException as e:
+                    counter += 1
+                    rospy.logerr("/gazebo/step_world service call failed...Retrying "+str(counter))
+                    # The world may or may not have been paused : read it again
+                    try:
+                        self.sync_pause_state()
+                    except rospy.ServiceException:
+                        self.paused = None
+            else:
+                error_message = "Maximum retries done"+str(self._max_retry)+", please check Gazebo step_world service"
+                rospy.logerr(error_message)
+                assert False, error_message
+
+    def setModelState(self, model_name, x, y, z, yaw=0.0):
+        """
+        Teleports a model to the given world position and yaw, with zero twist.
+        """
+        state = ModelState()
+        state.model_name = model_name
+        state.reference_frame = "world"
+        state.pose.position.x = x
+        state.pose.position.y = y
+        state.pose.position.z = z
+        state.pose.orientation.z = math.sin(yaw / 2)
+        state.pose.orientation.w = math.cos(yaw / 2)
+        return self.applyModelState(state)
+
+    def applyModelState(self, state):
+        """
+        Sets the pose and twist of a model from a gazebo_msgs/ModelState, e.g. one returned by getModelState.
+        """
+        try:
+            result = self.set_model_state_proxy(state)
+            if not result.success:
+                rospy.logerr("/gazebo/set_model_state failed for "+state.model_name+" : "+result.status_message)
+            return result.success
+        except rospy.ServiceException as e:
+            rospy.logerr("/gazebo/set_model_state service call failed")
+            return False
+
+    def getModelState(self, model_name):
+        """
+        Returns the current pose and twist of a model, in the world frame, as a gazebo_msgs/ModelState
+        (None if the call failed).
+        """
+        try:
+            result = self.get_model_state_proxy(model_name, "world")
+        except rospy.ServiceException as e:
+            rospy.logerr("/gazebo/get_model_state service call failed")
+            return None
+        if not result.success:
+            rospy.logerr("/gazebo/get_model_state failed for "+model_name+" : "+result.status_message)
+            return None
+
+        state = ModelState()
+        state.model_name = model_name
+        state.reference_frame = "world"
+        state.pose = result.pose
+        state.twist = result.twist
+        return state
+
+    def get_time_step(self):
+        """Returns the duration of one physics iteration, in seconds"""
+        return self.get_physics().time_step
+
 
     def resetSim(self):
         """
@@ -92,19 +263,28 @@ class GazeboConnection():
             rospy.logdebug("WRONG Reset Option:"+str(self.reset_world_or_sim))
 
     def resetSimulation(self):
-        rospy.wait_for_service('/gazebo/reset_simulation')
         try:
             self.reset_simulation_proxy()
         except rospy.ServiceException as e:
             print ("/gazebo/reset_simulation service call failed")
 
     def resetWorld(self):
-        rospy.wait_for_service('/gazebo/reset_world')
         try:
             self.reset_world_proxy()
         except rospy.ServiceException as e:
             print ("/gazebo/reset_world service call failed")
 
+    def service_stats(self):
+        """
+        {service name: (calls, failures, connections, (p50, p95, p99) latency in ms)} for the services called so far
+        """
+        services = [self.unpause, self.pause, self.reset_simulation_proxy, self.reset_world_proxy,
+                    self.set_model_state_proxy, self.get_model_state_proxy, self.get_physics, self.set_physics,
+                    self.step_world_proxy]
+        return {service.name: (service.calls, service.failures, service.connections,
+                               tuple(1000 * service.latency.percentiles()))
+                for service in services if service is not None and service.calls > 0}
+
     def init_values(self):
 
         self.resetSim()
@@ -143,6 +323,17 @@ class GazeboConnection():
         self.update_gravity_call()
 
 
+    def read_physics_parameters(self):
+        """
+        Uses the current physics parameters of Gazebo as the base of the next set_physics_properties requests,
+        for connections created without start_init_physics_parameters.
+        """
+        physics = self.get_physics()
+        self._time_step = Float64(physics.time_step)
+        self._max_update_rate = Float64(physics.max_update_rate)
+        self._gravity = physics.gravity
+        self._ode_config = physics.ode_config
+
     def update_gravity_call(self):
 
         self.pauseSim()
@@ -160,7 +351,55 @@ class GazeboConnection():
 
         self.unpauseSim()
 
+    def set_physics_parameters(self, max_update_rate=None, sor_pgs_iters=None):
+        """
+        Changes the update rate (0 : as fast as possible) and/or the ODE solver iterations, keeping the other
+        physics parameters. Like update_gravity_call, the simulation is unpaused afterwards.
+        """
+        if self._ode_config is None:
+            self.read_physics_parameters()
+        if max_update_rate is not None:
+            self._max_update_rate.data = max_update_rate
+        if sor_pgs_iters is not None:
+            self._ode_config.sor_pgs_iters = sor_pgs_iters
+
+        self.update_gravity_call()
+
+    def tune_physics(self, evaluate, candidates=((1000.0, 50), (0.0, 50), (0.0, 30), (0.0, 20), (0.0, 10)),
+                     tolerance=0.2):
+        """
+        Tries each (max_update_rate, sor_pgs_iters) candidate and keeps the fastest one whose control fidelity
+        is close enough to the first candidate, which is the reference setting.
+
+        evaluate() runs a canned control sequence on the unpaused simulation and returns its tracking error.
+        The real time factor is measured around it (simulated time / wall time). A candidate is accepted if its
+        error is at most (1 + tolerance) times the reference error.
+        :return: the chosen (max_update_rate, sor_pgs_iters) and, for each candidate, (real time factor, error)
+        """
+        results = []
+        for max_update_rate, sor_pgs_iters in candidates:
+            self.set_physics_parameters(max_update_rate, sor_pgs_iters)
+
+            sim_start, wall_start = rospy.get_rostime().to_sec(), time.time()
+            error = evaluate()
+            real_time_factor = (rospy.get_rostime().to_sec() - sim_start) / max(time.time() - wall_start, 1e-9)
+
+            results.append((real_time_factor, error))
+            rospy.loginfo("Physics max_update_rate="+str(max_update_rate)+", sor_pgs_iters="+str(sor_pgs_iters)+
+                          " : real time factor "+str(round(real_time_factor, 2))+", tracking error "+str(round(error, 4)))
+
+        max_error = results[0][1] * (1 + tolerance)
+        accepted = [i for i, (_, error) in enumerate(results) if error <= max_error]
+        best = max(accepted, key=lambda i: results[i][0])
+
+        self.set_physics_parameters(*candidates[best])
+        self.pauseSim()
+        rospy.loginfo("Physics tuned : max_update_rate="+str(candidates[best][0])+", sor_pgs_iters="+str(candidates[best][1]))
+        return candidates[best], results
+
     def change_gravity(self, x, y, z):
+        if self._ode_config is None:
+            self.read_physics_parameters()
         self._gravity.x = x
         self._gravity.y = y
         self._gravity.z = z
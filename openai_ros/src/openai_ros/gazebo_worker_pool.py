@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Pool de K simulations Gazebo independantes, chacune dans son propre processus.
+
+Chaque worker a son propre ROS master et son propre gzserver (ROS_MASTER_URI et
+GAZEBO_MASTER_URI sur des ports differents) : les topics /L_bebop2, /R_bebop2 et
+/gazebo des differentes simulations ne se melangent pas. Le pool expose la meme
+interface que DoubleBebop2SimVecEnv : step(actions[K, 3]) renvoie obs[K, 3],
+rewards[K], dones[K], info et les episodes termines sont relances automatiquement.
+"""
+import importlib
+import multiprocessing
+import os
+import signal
+import subprocess
+import time
+
+import numpy as np
+
+
+def _worker(remote, env_id, env_module, ros_port, gazebo_port, env_kwargs):
+    # Le worker et tout ce qu'il lance (roscore, roslaunch, gzserver) forment un groupe de processus
+    os.setpgrp()
+    os.environ["ROS_MASTER_URI"] = "http://localhost:{}".format(ros_port)
+    os.environ["GAZEBO_MASTER_URI"] = "http://localhost:{}".format(gazebo_port)
+
+    # Import apres la configuration des URI
+    import gym
+    import rosgraph
+    import rospy
+
+    roscore = subprocess.Popen(["roscore", "-p", str(ros_port)], stdout=subprocess.DEVNULL)
+    while not rosgraph.is_master_online():
+        time.sleep(0.1)
+
+    rospy.init_node("gazebo_worker_{}".format(ros_port), anonymous=True, disable_signals=True)
+    importlib.import_module(env_module)
+    env = gym.make(env_id, **env_kwargs)
+
+    try:
+        while True:
+            cmd, data = remote.recv()
+            if cmd == "step":
+                obs, reward, done, info = env.step(data)
+                if done:
+                    info["terminal_observation"] = obs
+                    obs = env.reset()
+                remote.send((obs, reward, done, info))
+            elif cmd == "reset":
+                remote.send(env.reset())
+            elif cmd == "seed":
+                remote.send(env.seed(data))
+            elif cmd == "spaces":
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == "close":
+                break
+            else:
+                raise NotImplementedError("Unknown command {}".format(cmd))
+    finally:
+        env.close()
+        remote.close()
+        roscore.terminate()
+        # Arrete roslaunch, gzserver et les noeuds de la simulation
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        os.killpg(0, signal.SIGINT)
+
+
+class GazeboWorkerPool(object):
+    """
+    K environnements Gazebo (par defaut DoubleBebop2Env-v0) executes en parallele.
+
+    Le worker i utilise le port base_port + 2*i pour son ROS master et base_port + 2*i + 1 pour
+    Gazebo. Les workers sont demarres avec la methode "spawn" : le processus principal peut
+    avoir deja appele rospy.init_node sur le master par defaut.
+    """
+
+    def __init__(self, num_envs, env_id="DoubleBebop2Env-v0",
+                 env_module="openai_ros.task_envs.bebop2.double_bebop2_task",
+                 env_kwargs=None, base_port=11411):
+        if env_kwargs is None:
+            env_kwargs = {"launch_args": ["headless:=true"]}
+
+        self.num_envs = num_envs
+        self.closed = False
+
+        ctx = multiprocessing.get_context("spawn")
+        self.remotes, self.processes = [], []
+        for i in range(num_envs):
+            remote, work_remote = ctx.Pipe()
+            args = (work_remote, env_id, env_module, base_port + 2 * i, base_port + 2 * i + 1, env_kwargs)
+            process = ctx.Process(target=_worker, args=args, daemon=True)
+            process.start()
+            work_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+        self.remotes[0].send(("spaces", None))
+        self.observation_space, self.action_space = self.remotes[0].recv()
+
+    def seed(self, seed=None):
+        for i, remote in enumerate(self.remotes):
+            remote.send(("seed", None if seed is None else seed + i))
+        return [remote.recv() for remote in self.remotes]
+
+    def reset(self):
+        for remote in self.remotes:
+            remote.send(("reset", None))
+        return np.stack([remote.recv() for remote in self.remotes])
+
+    def step(self, actions):
+        actions = np.asarray(actions).reshape(self.num_envs, -1)
+        # Toutes les simulations avancent en meme temps
+        for remote, action in zip(self.remotes, actions):
+            remote.send(("step", action))
+        results = [remote.recv() for remote in self.remotes]
+
+        obs, rewards, dones, infos = zip(*results)
+        obs = np.stack(obs)
+        rewards = np.array(rewards, dtype=np.float64)
+        dones = np.array(dones, dtype=bool)
+
+        info = {}
+        if dones.any():
+            info["terminal_observation"] = np.stack([i.get("terminal_observation", o) for i, o in zip(infos, obs)])
+            info["truncated"] = np.array([i.get("TimeLimit.truncated", False) for i in infos], dtype=bool)
+
+        return obs, rewards, dones, info
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
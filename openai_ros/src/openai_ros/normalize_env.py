@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+import gym
+import numpy as np
+
+
+def merge_moments(count_a, mean_a, m2_a, count_b, mean_b, m2_b):
+    """Fusion exacte de deux ensembles de statistiques (effectif, moyenne, somme des carrés des ecarts)"""
+    count = count_a + count_b
+    if count == 0:
+        return count, mean_a, m2_a
+    delta = mean_b - mean_a
+    mean = mean_a + delta * count_b / count
+    m2 = m2_a + m2_b + delta ** 2 * count_a * count_b / count
+    return count, mean, m2
+
+
+class RunningMeanStd(object):
+    """
+    Moyenne et variance courantes (Welford, mises a jour par batch avec merge_moments).
+
+    Comme RunningMeanStd de baselines, les statistiques partent d'un effectif epsilon de moyenne 0 et de variance 1,
+    pour que les premiers echantillons ne soient pas divisés par un ecart type quasi nul.
+
+    new_count, new_mean et new_m2 ne gardent que ce que ce worker a ajouté depuis le dernier sync() : sync() les
+    somme sur tous les workers et chacun repart des memes statistiques globales.
+    """
+
+    def __init__(self, shape=(), epsilon=1e-4):
+        self.shape = tuple(shape)
+        self.count, self.mean, self.m2 = epsilon, np.zeros(self.shape), np.full(self.shape, epsilon)
+        self._base = (self.count, self.mean, self.m2)
+        self._reset_new()
+
+    def _reset_new(self):
+        self.new_count, self.new_mean, self.new_m2 = 0.0, np.zeros(self.shape), np.zeros(self.shape)
+
+    @property
+    def var(self):
+        return self.m2 / self.count if self.count > 0 else np.ones(self.shape)
+
+    @property
+    def std(self):
+        return np.sqrt(self.var + 1e-8)
+
+    def update(self, x):
+        """Ajoute un echantillon de shape `shape` ou un batch (N, *shape)"""
+        x = np.asarray(x, dtype=np.float64).reshape((-1,) + self.shape)
+        if len(x) == 0:
+            return
+        mean = x.mean(axis=0)
+        moments = (len(x), mean, ((x - mean) ** 2).sum(axis=0))
+        self.count, self.mean, self.m2 = merge_moments(self.count, self.mean, self.m2, *moments)
+        self.new_count, self.new_mean, self.new_m2 = merge_moments(self.new_count, self.new_mean, self.new_m2,
+                                                                   *moments)
+
+    def sync(self, allreduce_sum):
+        """
+        Fusion exacte des ajouts de tous les workers depuis le dernier sync(), appelée par tous les workers en meme
+        temps. allreduce_sum(x) renvoie la somme de x sur les workers (mpi_tools.mpi_sum64).
+        """
+        count = float(allreduce_sum(self.new_count))
+        if count > 0:
+            mean = allreduce_sum(self.new_count * self.new_mean) / count
+            m2 = allreduce_sum(self.new_m2 + self.new_count * (self.new_mean - mean) ** 2)
+            self.count, self.mean, self.m2 = merge_moments(*self._base, count, mean, m2)
+            self._base = (self.count, self.mean, self.m2)
+        self._reset_new()
+
+    def state_dict(self):
+        return {"count": self.count, "mean": self.mean, "m2": self.m2}
+
+    def load_state_dict(self, state):
+        self.count = float(state["count"])
+        self.mean = np.asarray(state["mean"], dtype=np.float64).reshape(self.shape)
+        self.m2 = np.asarray(state["m2"], dtype=np.float64).reshape(self.shape)
+        self._base = (self.count, self.mean, self.m2)
+        self._reset_new()
+
+
+def load_stats(path):
+    """(obs_rms, ret_rms) enregistrés par NormalizeEnv.save"""
+    data = np.load(path)
+    obs_rms, ret_rms = RunningMeanStd(data["obs_mean"].shape), RunningMeanStd(())
+    obs_rms.load_state_dict({k: data[f"obs_{k}"] for k in ("count", "mean", "m2")})
+    ret_rms.load_state_dict({k: data[f"ret_{k}"] for k in ("count", "mean", "m2")})
+    return obs_rms, ret_rms
+
+
+class NormalizeEnv(gym.Wrapper):
+    """
+    Normalise les observations (moyenne et ecart type courants) et les rewards (divisées par l'ecart type courant du
+    retour actualisé, comme VecNormalize de baselines), puis les coupe a +/- clip.
+
+    Marche aussi avec un env vectorisé (DoubleBebop2SimVecEnv) : obs, rewards et dones ont alors une dimension N.
+    La reward d'origine est dans info["raw_reward"]. freeze() arrete la mise a jour des statistiques (evaluation),
+    save() et load() les gardent avec les poids du modele.
+    """
+
+    def __init__(self, env, normalize_obs=True, normalize_reward=True, gamma=0.99, clip_obs=10.0, clip_reward=10.0):
+        super(NormalizeEnv, self).__init__(env)
+        self.normalize_obs_enabled = normalize_obs
+        self.normalize_reward_enabled = normalize_reward
+        self.gamma = gamma
+        self.clip_obs = clip_obs
+        self.clip_reward = clip_reward
+
+        self.obs_rms = RunningMeanStd(env.observation_space.shape)
+        self.ret_rms = RunningMeanStd(())
+        self.returns = 0.0
+        self.training = True
+
+    def freeze(self):
+        self.training = False
+
+    def unfreeze(self):
+        self.training = True
+
+    def reset(self, **kwargs):
+        obs = self.env.reset(**kwargs)
+        self.returns = np.zeros_like(self.returns)
+        if self.training:
+            self.obs_rms.update(obs)
+        return self.normalize_obs(obs)
+
+    def step(self, action):
+        obs, reward, done, info = self.env.step(action)
+        # La reward est mise a l'echelle avant d'ajouter son retour aux statistiques : un seul retour a une variance
+        # nulle, la premiere reward serait toujours coupée a +/- clip_reward
+        normalized_reward = self.normalize_reward(reward)
+        if self.training:
+            self.obs_rms.update(obs)
+            self.returns = self.returns * self.gamma + reward
+            self.ret_rms.update(self.returns)
+        self.returns = np.where(done, 0.0, self.returns)
+
+        info["raw_reward"] = reward
+        if "terminal_observation" in info:
+            info["terminal_observation"] = self.normalize_obs(info["terminal_observation"])
+        return self.normalize_obs(obs), normalized_reward, done, info
+
+    def normalize_obs(self, obs):
+        if not self.normalize_obs_enabled:
+            return obs
+        return np.clip((obs - self.obs_rms.mean) / self.obs_rms.std, -self.clip_obs, self.clip_obs)
+
+    def normalize_reward(self, reward):
+        if not self.normalize_reward_enabled:
+            return reward
+        return np.clip(reward / self.ret_rms.std, -self.clip_reward, self.clip_reward)
+
+    def save(self, path):
+        np.savez(path, **{f"obs_{k}": v for k, v in self.obs_rms.state_dict().items()},
+                 **{f"ret_{k}": v for k, v in self.ret_rms.state_dict().items()})
+
+    def load(self, path):
+        obs_rms, ret_rms = load_stats(path)
+        self.obs_rms.load_state_dict(obs_rms.state_dict())
+        self.ret_rms.load_state_dict(ret_rms.state_dict())
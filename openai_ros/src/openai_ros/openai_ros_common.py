@@ -37,7 +37,11 @@ def StartOpenAI_ROS_Environment(task_and_robot_environment_name):
 
 
 class ROSLauncher(object):
-    def __init__(self, rospackage_name, launch_file_name, ros_ws_abspath="/home/user/simulation_ws"):
+    def __init__(self, rospackage_name, launch_file_name, ros_ws_abspath="/home/user/simulation_ws", launch_args=()):
+        """
+        launch_args: arguments given to roslaunch, e.g. ["gui:=false"]
+        The launch uses the ROS_MASTER_URI and GAZEBO_MASTER_URI of the current environment.
+        """
 
         self._rospackage_name = rospackage_name
         self._launch_file_name = launch_file_name
@@ -73,7 +77,7 @@ class ROSLauncher(object):
             rospy.logdebug("path_launch_file_name=="+str(path_launch_file_name))
 
             source_env_command = "source "+ros_ws_abspath+"/devel/setup.bash;"
-            roslaunch_command = "roslaunch  {0} {1}".format(rospackage_name, launch_file_name)
+            roslaunch_command = "roslaunch  {0} {1} {2}".format(rospackage_name, launch_file_name, " ".join(launch_args))
             command = source_env_command+roslaunch_command
             rospy.logdebug("Launching command="+str(command))
 
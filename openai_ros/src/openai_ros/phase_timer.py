@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+import time
+import numpy as np
+import rospy
+
+
+class RollingWindow(object):
+    """Les `size` dernieres durées d'une phase, dans un buffer circulaire"""
+
+    def __init__(self, size):
+        self.values = np.zeros(size)
+        self.index = 0
+        self.count = 0
+
+    def add(self, value):
+        self.values[self.index] = value
+        self.index = (self.index + 1) % len(self.values)
+        self.count = min(self.count + 1, len(self.values))
+
+    def percentiles(self, q=(50, 95, 99)):
+        return np.percentile(self.values[:self.count], q)
+
+
+class PhaseTimer(object):
+    """
+    Chronometre par phase d'une fonction (step, reset...).
+
+    start() au debut de la fonction, lap("phase") a la fin de chaque phase, stop() a la fin. La durée de chaque
+    phase et la durée totale sont gardées sur les `window` derniers appels, summary() en donne p50/p95/p99.
+    Desactivé (enabled=False), chaque appel se limite a un test de booleen.
+    """
+
+    def __init__(self, name, enabled=False, window=1000, dump_every=0):
+        """
+        Args:
+            name (str): nom affiché par dump()
+            enabled (bool, optional): active la mesure. Defaults to False.
+            window (int, optional): nombre d'appels gardés pour les percentiles. Defaults to 1000.
+            dump_every (int, optional): si > 0, dump() est appelée tous les dump_every appels. Defaults to 0.
+        """
+        self.name = name
+        self.enabled = enabled
+        self.window = window
+        self.dump_every = dump_every
+
+        self.phases = {}
+        self.last = {}
+        self.count = 0
+        self._start = 0.0
+        self._lap = 0.0
+
+    def start(self):
+        if not self.enabled:
+            return
+        self.last = {}
+        self._start = self._lap = time.perf_counter()
+
+    def lap(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self._add(phase, now - self._lap)
+        self._lap = now
+
+    def stop(self):
+        if not self.enabled:
+            return
+        self._add("total", time.perf_counter() - self._start)
+        self.count += 1
+        if self.dump_every and self.count % self.dump_every == 0:
+            self.dump()
+
+    def _add(self, phase, duration):
+        window = self.phases.get(phase)
+        if window is None:
+            window = self.phases[phase] = RollingWindow(self.window)
+        window.add(duration)
+        self.last[phase] = duration
+
+    def summary(self):
+        """{phase: (p50, p95, p99)} en millisecondes"""
+        return {phase: tuple(1000 * window.percentiles()) for phase, window in self.phases.items()}
+
+    def dump(self):
+        lines = [f"{self.name} latency over the last {min(self.count, self.window)} calls (p50 / p95 / p99 ms)"]
+        for phase, (p50, p95, p99) in self.summary().items():
+            lines.append(f"  {phase:<20} {p50:8.2f} {p95:8.2f} {p99:8.2f}")
+        rospy.loginfo("\n".join(lines))
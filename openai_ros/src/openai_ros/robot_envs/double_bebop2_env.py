@@ -1,17 +1,195 @@
 #!/usr/bin/env python
 from openai_ros import robot_gazebo_env
+from openai_ros.step_scheduler import StepScheduler
 from sensor_msgs.msg import Image
 from nav_msgs.msg import Odometry
 from geometry_msgs.msg import Twist, Pose
 from std_msgs.msg import Empty
 import rospy
 import numpy as np
+import threading
+import time
+
+# Index des drones dans OdometryBuffer.state
+L, R = 0, 1
+
+# Colonnes d'une ligne de OdometryBuffer.state
+STAMP = 0
+POSITION = slice(1, 4)
+ORIENTATION = slice(4, 8)
+LINEAR = slice(8, 11)
+ANGULAR = slice(11, 14)
+ODOM_SIZE = 14
+
+# Nombre d'odometries gardées par drone pour read_synchronized
+HISTORY_SIZE = 10
+
+
+class OdometryBuffer(object):
+    """
+    Derniere odometrie des deux drones dans un tableau (2, ODOM_SIZE) préalloué : une ligne par drone avec
+    stamp, position, quaternion (x, y, z, w), vitesse lineaire et vitesse angulaire.
+
+    Les callbacks ecrivent avec write(), les lectures passent par read() qui renvoie une copie coherente des
+    deux lignes. Le compteur de sequence est impair pendant une ecriture : une lecture qui chevauche une
+    ecriture est recommencée, on ne melange donc jamais deux odometries d'un meme drone.
+
+    Les history_size dernieres odometries de chaque drone sont aussi gardées (buffer circulaire history) pour
+    read_synchronized, qui ramene les deux drones au meme instant simulé.
+    """
+
+    def __init__(self, history_size=HISTORY_SIZE):
+        self.state = np.zeros((2, ODOM_SIZE))
+        self.history = np.zeros((2, history_size, ODOM_SIZE))
+        self.head = [0, 0]
+        self.written = [False, False]
+        self.seq = 0
+        self._write_lock = threading.Lock()
+
+    def write(self, index, msg):
+        p, q = msg.pose.pose.position, msg.pose.pose.orientation
+        v, w = msg.twist.twist.linear, msg.twist.twist.angular
+        row = (msg.header.stamp.to_sec(), p.x, p.y, p.z, q.x, q.y, q.z, q.w, v.x, v.y, v.z, w.x, w.y, w.z)
+
+        # Un thread par subscriber : les ecritures de L et R sont serialisées
+        with self._write_lock:
+            self.seq += 1
+            self._store(index, row)
+            self.seq += 1
+
+    def write_rows(self, rows):
+        """Ecrit les deux lignes d'un coup, par exemple depuis un message rotors_comm/PairState.
+        Une ligne de stamp nul n'a jamais été remplie (drone pas encore reçu) et n'est pas ecrite."""
+        rows = np.reshape(rows, (2, ODOM_SIZE))
+        with self._write_lock:
+            self.seq += 1
+            for index in (L, R):
+                if rows[index, STAMP] != 0:
+                    self._store(index, rows[index])
+            self.seq += 1
+
+    def _store(self, index, row):
+        if not self.written[index] or row[STAMP] < self.state[index, STAMP]:
+            # Premier message, ou le temps simulé est revenu en arriere (reset du monde) : on repart d'un historique neuf
+            self.history[index] = row
+            self.written[index] = True
+        else:
+            self.history[index, self.head[index]] = row
+        self.head[index] = (self.head[index] + 1) % self.history.shape[1]
+        self.state[index] = row
+
+    def read(self):
+        return self._read(self.state)
+
+    def read_synchronized(self):
+        """
+        Etat des deux drones au meme instant : le plus recent stamp connu des deux drones. Le drone dont
+        l'odometrie est plus recente est interpolé (lineairement, quaternion normalisé) entre les deux odometries
+        de son historique qui encadrent ce stamp.
+        """
+        history = self._read(self.history)
+        stamp = history[:, :, STAMP].max(axis=1).min()
+
+        state = np.empty((2, ODOM_SIZE))
+        state[L] = self._interpolate(history[L], stamp)
+        state[R] = self._interpolate(history[R], stamp)
+        return state
+
+    def _read(self, array):
+        while True:
+            seq = self.seq
+            if seq % 2 == 0:
+                copy = array.copy()
+                if self.seq == seq:
+                    return copy
+
+    @staticmethod
+    def _interpolate(history, stamp):
+        history = history[np.argsort(history[:, STAMP])]
+        k = np.searchsorted(history[:, STAMP], stamp)
+        if k == 0:
+            return history[0]
+        if k == len(history):
+            return history[-1]
+
+        before, after = history[k - 1], history[k].copy()
+        alpha = (stamp - before[STAMP]) / (after[STAMP] - before[STAMP])
+
+        # q et -q sont la meme orientation : on interpole sur le plus court chemin
+        if np.dot(before[ORIENTATION], after[ORIENTATION]) < 0:
+            after[ORIENTATION] *= -1
+        row = before + alpha * (after - before)
+        row[ORIENTATION] /= np.linalg.norm(row[ORIENTATION])
+        return row
+
+
+class PublisherReadiness(rospy.SubscribeListener):
+    """
+    Cache de l'etat de connexion des publishers, mis a jour par les callbacks de connexion/deconnexion
+    des abonnés. check_publisher le consulte en O(1) au lieu d'interroger get_num_connections a chaque publication.
+    """
+
+    def __init__(self):
+        super(PublisherReadiness, self).__init__()
+        self.ready = {}
+
+    def peer_subscribe(self, topic_name, topic_publish, peer_publish):
+        self.ready[topic_name] = True
+
+    def peer_unsubscribe(self, topic_name, num_peers):
+        if num_peers == 0:
+            rospy.logwarn(f"{topic_name} lost its last subscriber")
+            self.ready[topic_name] = False
+
+    def is_ready(self, pub):
+        return self.ready.get(pub.resolved_name, False)
+
+    def set_ready(self, pub, ready):
+        self.ready[pub.resolved_name] = ready
 
 
 class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
 
-    def __init__(self):
+    def __init__(self, step_mode="REALTIME", control_period=0.03, lockstep_iterations=None, profile=False, profile_dump_every=0,
+                 use_relay=False, action_repeat=1, fixed_rate=False, free_run=False):
+        """
+        Args:
+            step_mode (str, optional): "REALTIME" : step() relance gazebo, publie les commandes, attend control_period
+                secondes puis remet gazebo en pause. "LOCKSTEP" : gazebo reste en pause et step() avance le monde d'exactement
+                lockstep_iterations iterations physiques (plugin step_world). Defaults to "REALTIME".
+            control_period (float, optional): Temps simulé couvert par une action. Defaults to 0.03.
+            lockstep_iterations (int, optional): Nombre d'iterations physiques par step en mode "LOCKSTEP".
+                Par defaut, control_period / time_step de gazebo.
+            profile (bool, optional): chronometre les phases de step() et reset() (voir RobotGazeboEnv). Defaults to False.
+            profile_dump_every (int, optional): affiche p50/p95/p99 tous les profile_dump_every appels. Defaults to 0.
+            use_relay (bool, optional): passe par le noeud pair_relay (mav_train.launch relay:=true) : un seul message
+                rotors_comm/PairState pour l'odometrie des deux drones et un seul rotors_comm/PairCommand pour leurs
+                commandes. Defaults to False.
+            action_repeat (int, optional): nombre de periodes de controle pendant lesquelles step() tient l'action, sans
+                mettre la simulation en pause entre elles. Les rewards sont sommées et la fin d'episode est testée a
+                chaque periode. Defaults to 1.
+            fixed_rate (bool, optional): en mode "REALTIME", les periodes de controle suivent une cadence fixe en temps
+                simulé (StepScheduler) : le temps passé a appeler les services et a calculer est deduit de l'attente.
+                Les depassements sont comptés et le retard du step est dans info["overrun"]. Defaults to False.
+            free_run (bool, optional): avec fixed_rate, la simulation n'est plus mise en pause entre deux steps, le calcul
+                de l'agent est pris sur la periode de controle. Defaults to False.
+        """
+        assert step_mode in ("REALTIME", "LOCKSTEP")
+        assert not fixed_rate or step_mode == "REALTIME", "fixed_rate needs the REALTIME step mode"
+        assert not free_run or fixed_rate, "free_run needs fixed_rate"
+        self.step_mode = step_mode
+        self.control_period = control_period
+        assert action_repeat >= 1
+        self.action_repeat = action_repeat
+        self.scheduler = StepScheduler(control_period, free_run=free_run) if fixed_rate else None
         self.stop_until = 0
+        self.hover_snapshot = None
+        self.odom = OdometryBuffer()
+        self.use_relay = use_relay
+        if self.use_relay:
+            from rotors_comm.msg import PairState, PairCommand
+            self.PairState = PairState
+            self.pair_cmd = PairCommand()
 
         # Topic names L_BEBOP
         self.L_image_name = "/L_bebop2/camera_base/image_raw"
@@ -23,6 +201,7 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
         self.L_takeoff_name = "/L_bebop2/takeoff"
         self.L_land_name = "/L_bebop2/land"
         self.L_reset_name = "/L_bebop2/fake_driver/reset_pose"
+        self.L_hover_name = "/L_bebop2/fake_driver/hover"
 
         # Topic names R_BEBOP
         self.R_image_name = "/R_bebop2/camera_base/image_raw"
@@ -33,7 +212,11 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
         self.R_takeoff_name = "/R_bebop2/takeoff"
         self.R_land_name = "/R_bebop2/land"
         self.R_reset_name = "/R_bebop2/fake_driver/reset_pose"
+        self.R_hover_name = "/R_bebop2/fake_driver/hover"
 
+        # Topic names du noeud pair_relay
+        self.pair_state_name = "/bebop2_pair/state"
+        self.pair_cmd_name = "/bebop2_pair/cmd"
 
 
         self.controllers_list = []
@@ -42,42 +225,63 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
                                                 robot_name_space=self.robot_name_space,
                                                 reset_controls=False,
                                                 start_init_physics_parameters = False,
-                                                reset_world_or_sim = "WORLD")
+                                                reset_world_or_sim = "WORLD",
+                                                profile=profile,
+                                                profile_dump_every=profile_dump_every)
 
         # Relance la physique de gazebo
         self.gazebo.unpauseSim()
 
-        # On regarde si tout est pret
-        self._check_all_sensor_ready()
-
 
         # SUBSCRIBING
-        # rospy.Subscriber(self.L_image_name, Image, self._L_img_cb)
-        rospy.Subscriber(self.L_odom_name, Odometry, self._L_odom_cb)
-        # rospy.Subscriber(self.L_pose_name, Pose, self._L_pose_cb)
+        if self.use_relay:
+            self.odom_topics = (self.pair_state_name, self.pair_state_name)
+            rospy.Subscriber(self.pair_state_name, self.PairState, self._pair_state_cb)
+        else:
+            self.odom_topics = (self.L_odom_name, self.R_odom_name)
+            # rospy.Subscriber(self.L_image_name, Image, self._L_img_cb)
+            rospy.Subscriber(self.L_odom_name, Odometry, self._L_odom_cb)
+            # rospy.Subscriber(self.L_pose_name, Pose, self._L_pose_cb)
 
-        # rospy.Subscriber(self.R_image_name, Image, self._R_img_cb)
-        rospy.Subscriber(self.R_odom_name, Odometry, self._R_odom_cb)
-        # rospy.Subscriber(self.R_pose_name, Pose, self._R_pose_cb)
+            # rospy.Subscriber(self.R_image_name, Image, self._R_img_cb)
+            rospy.Subscriber(self.R_odom_name, Odometry, self._R_odom_cb)
+            # rospy.Subscriber(self.R_pose_name, Pose, self._R_pose_cb)
 
 
         # Publishers
         rospy.logdebug("Finished subscribing")
-        self.L_cmd_pub = rospy.Publisher(self.L_cmd_vel_name, Twist, queue_size=0)
-        self.L_land_pub = rospy.Publisher(self.L_land_name, Empty, queue_size=0)
-        self.L_takeoff_pub = rospy.Publisher(self.L_takeoff_name, Empty, queue_size=1)
-        self.L_reset_pub = rospy.Publisher(self.L_reset_name, Empty, queue_size=1)
+        self.pub_readiness = PublisherReadiness()
+        self.L_cmd_pub = rospy.Publisher(self.L_cmd_vel_name, Twist, queue_size=0, subscriber_listener=self.pub_readiness)
+        self.L_land_pub = rospy.Publisher(self.L_land_name, Empty, queue_size=0, subscriber_listener=self.pub_readiness)
+        self.L_takeoff_pub = rospy.Publisher(self.L_takeoff_name, Empty, queue_size=1, subscriber_listener=self.pub_readiness)
+        self.L_reset_pub = rospy.Publisher(self.L_reset_name, Empty, queue_size=1, subscriber_listener=self.pub_readiness)
+        self.L_hover_pub = rospy.Publisher(self.L_hover_name, Empty, queue_size=1, subscriber_listener=self.pub_readiness)
 
-        self.R_cmd_pub = rospy.Publisher(self.R_cmd_vel_name, Twist, queue_size=1)
-        self.R_land_pub = rospy.Publisher(self.R_land_name, Empty, queue_size=1)
-        self.R_takeoff_pub = rospy.Publisher(self.R_takeoff_name, Empty, queue_size=1)
-        self.R_reset_pub = rospy.Publisher(self.R_reset_name, Empty, queue_size=1)
+        self.R_cmd_pub = rospy.Publisher(self.R_cmd_vel_name, Twist, queue_size=1, subscriber_listener=self.pub_readiness)
+        self.R_land_pub = rospy.Publisher(self.R_land_name, Empty, queue_size=1, subscriber_listener=self.pub_readiness)
+        self.R_takeoff_pub = rospy.Publisher(self.R_takeoff_name, Empty, queue_size=1, subscriber_listener=self.pub_readiness)
+        self.R_reset_pub = rospy.Publisher(self.R_reset_name, Empty, queue_size=1, subscriber_listener=self.pub_readiness)
+        self.R_hover_pub = rospy.Publisher(self.R_hover_name, Empty, queue_size=1, subscriber_listener=self.pub_readiness)
 
+        # Publishers dont on attend un abonné avant de commencer
+        self.checked_publishers = [self.L_cmd_pub, self.L_takeoff_pub, self.L_land_pub,
+                                   self.R_cmd_pub, self.R_takeoff_pub, self.R_land_pub]
 
+        if self.use_relay:
+            self.pair_cmd_pub = rospy.Publisher(self.pair_cmd_name, type(self.pair_cmd), queue_size=1, subscriber_listener=self.pub_readiness)
+            self.checked_publishers.append(self.pair_cmd_pub)
 
-        self._check_all_pub_ready()
+
+        # On regarde si tout est pret, en laissant a Gazebo le temps de lancer les drones
+        self.wait_until_ready(timeout=30.0)
 
         rospy.logdebug("checked_allpub")
+
+        if self.step_mode == "LOCKSTEP":
+            if lockstep_iterations is None:
+                lockstep_iterations = int(round(self.control_period / self.gazebo.get_time_step()))
+            self.lockstep_iterations = max(1, lockstep_iterations)
+            rospy.logdebug(f"LOCKSTEP mode : {self.lockstep_iterations} physics iterations per step")
         # On met en pause la simulation, c'est maintenant a la task de prendre le relai
         self.gazebo.pauseSim()
 
@@ -95,43 +299,45 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
         Checks that all the sensors, publishers and other simulation systems are
         operational.
         """
-        self._check_all_sensor_ready()
-        self._check_all_pub_ready()
+        self.wait_until_ready()
         return True
 
-    def _check_all_sensor_ready(self):
-        # self.L_image_raw = self.check_sensor(self.L_image_name, Image)
-        self.L_odom = self.check_sensor(self.L_odom_name, Odometry)
-        # self.L_pose = self.check_sensor(self.L_pose_name, Pose)
-        
-        # self.R_image_raw = self.check_sensor(self.R_image_name, Image)
-        self.R_odom = self.check_sensor(self.R_odom_name, Odometry)
-        # self.R_pose = self.check_sensor(self.R_pose_name, Pose)
-        rospy.logdebug("ALL SENSORS READY")
-    
-    def _check_all_pub_ready(self):
-        self.check_publisher(self.L_cmd_pub)
-        self.check_publisher(self.L_takeoff_pub)
-        self.check_publisher(self.L_land_pub)
+    def wait_until_ready(self, timeout=5.0):
+        """
+        Attend en meme temps l'odometrie des deux drones et un abonné sur chaque publisher de checked_publishers.
+        Ce qui est deja connu comme pret (odometrie deja reçue, publisher connecté d'apres le cache) n'est pas
+        re-verifié. S'il manque encore quelque chose apres timeout secondes, leve rospy.ROSException qui le liste.
+        """
+        waited_pubs = [pub for pub in self.checked_publishers if not self.pub_readiness.is_ready(pub)]
+        pending_pubs = waited_pubs
+        deadline = time.time() + timeout
+
+        while not rospy.is_shutdown():
+            pending_pubs = [pub for pub in pending_pubs if pub.get_num_connections() == 0]
+            missing_odom = [topic for topic, written in zip(self.odom_topics, self.odom.written) if not written]
+            if not pending_pubs and not missing_odom:
+                break
 
-        self.check_publisher(self.R_cmd_pub)
-        self.check_publisher(self.R_takeoff_pub)
-        self.check_publisher(self.R_land_pub)
-        rospy.logdebug("ALL PUBLISHERS READY")
+            if time.time() > deadline:
+                raise rospy.ROSException(f"Timeout ({timeout} s) waiting for {sorted(set(missing_odom))} "
+                                         f"and subscribers to {[pub.name for pub in pending_pubs]}")
+            try:
+                rospy.sleep(0.01)
+            except rospy.ROSInterruptException:
+                # This is to avoid error when world is rested, time when backwards.
+                pass
 
+        for pub in waited_pubs:
+            self.pub_readiness.set_ready(pub, pub.get_num_connections() > 0)
+        rospy.logdebug("ALL SENSORS AND PUBLISHERS READY")
+
+    def check_publisher(self, pub : rospy.Publisher, use_cache=True):
+        """Attend qu'au moins un abonné soit connecté a pub.
+        Avec use_cache, on retourne directement si le cache (mis a jour par les callbacks de connexion) dit que c'est le cas.
+        """
+        if use_cache and self.pub_readiness.is_ready(pub):
+            return
 
-    def check_sensor(self, topic_name, topic_type):
-        msg = None
-        rospy.logdebug(f"Waiting for {topic_name} to be Ready")
-        while msg is None and not rospy.is_shutdown():
-            try:
-                msg = rospy.wait_for_message(topic_name, topic_type, timeout=5.0)
-                rospy.logdebug(f"Current {topic_name} READY=>")
-            except:
-                rospy.logerr(f"Current {topic_name} not ready yet, retrying for getting the topic")
-        return msg
-    
-    def check_publisher(self, pub : rospy.Publisher):
         rate = rospy.Rate(10)  
         while pub.get_num_connections() == 0 and not rospy.is_shutdown():
             rospy.logdebug(f"No susbribers to {pub.name} so we wait and try again")
@@ -141,6 +347,7 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
                 # This is to avoid error when world is rested, time when backwards.
                 pass
         rospy.logdebug(f"{pub.name} Publisher Connected")
+        self.pub_readiness.set_ready(pub, pub.get_num_connections() > 0)
 
         rospy.logdebug(f"{pub.name} Ready")
     
@@ -151,7 +358,7 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
     #     self.L_image_raw = data
 
     def _L_odom_cb(self, data):
-        self.L_odom = data
+        self.odom.write(L, data)
 
 
 
@@ -162,10 +369,31 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
     #     self.R_image_raw = data
 
     def _R_odom_cb(self, data):
-        self.R_odom = data
+        self.odom.write(R, data)
+
+    def _pair_state_cb(self, data):
+        self.odom.write_rows(data.state)
 
     # def _R_pose_cb(self, data):
     #     self.R_pose = data
+
+    #### ETAT DES DRONES
+    @property
+    def L_position(self):
+        return self.odom.read()[L, POSITION]
+
+    @property
+    def R_position(self):
+        return self.odom.read()[R, POSITION]
+
+    @property
+    def L_velocity(self):
+        return self.odom.read()[L, LINEAR]
+
+    @property
+    def R_velocity(self):
+        return self.odom.read()[R, LINEAR]
+
     # Methods that the TrainingEnvironment will need to define here as virtual
     # because they will be used in RobotGazeboEnv GrandParentClass and defined in the
     # TrainingEnvironment.
@@ -195,6 +423,14 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
     def _get_obs(self):
         raise NotImplementedError()
 
+    def _count_step(self):
+        """Appelé une fois par step() de l'agent, quel que soit action_repeat"""
+        pass
+
+    def _get_state(self):
+        """Etat complet du dernier pas, renvoyé dans info["state"] (None : pas d'etat)"""
+        return None
+
     def _is_done(self, observations):
         """Checks if episode done based on observations given.
         """
@@ -229,6 +465,41 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
         self.R_reset_pub.publish(Empty())
         # self.gazebo.pauseSim()
 
+    def teleport(self, L_position, R_position):
+        """Place directement les drones (x, y, z) avec une vitesse nulle par /gazebo/set_model_state,
+        puis demande a fake_driver de tenir cette position en vol stationnaire.
+        La simulation doit etre en pause.
+        """
+        self.gazebo.setModelState("L_bebop2", *L_position)
+        self.gazebo.setModelState("R_bebop2", *R_position)
+
+        self.check_publisher(self.L_hover_pub)
+        self.L_hover_pub.publish(Empty())
+        self.check_publisher(self.R_hover_pub)
+        self.R_hover_pub.publish(Empty())
+
+    def snapshot_hover(self):
+        """Enregistre la pose et la vitesse des deux drones (la simulation doit etre en pause, drones en vol stationnaire).
+        :return: True si l'etat des deux drones a pu etre lu
+        """
+        snapshot = [self.gazebo.getModelState("L_bebop2"), self.gazebo.getModelState("R_bebop2")]
+        if None in snapshot:
+            return False
+        self.hover_snapshot = snapshot
+        return True
+
+    def restore_hover(self):
+        """Remet les drones dans l'etat de snapshot_hover en un appel de service par drone. fake_driver reprend la pose
+        restaurée comme consigne de vol stationnaire. La simulation doit etre en pause.
+        """
+        for state in self.hover_snapshot:
+            self.gazebo.applyModelState(state)
+
+        self.check_publisher(self.L_hover_pub)
+        self.L_hover_pub.publish(Empty())
+        self.check_publisher(self.R_hover_pub)
+        self.R_hover_pub.publish(Empty())
+
     def land(self, mode = "both"):
         """Envoi un message Empty dans les publishers des drones en fonction du paramètre mode
 
@@ -272,12 +543,7 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
 
         self.gazebo.unpauseSim()
         while not rospy.is_shutdown() and start_wait_time + 4 > rospy.get_rostime().to_sec():
-            if mode == "L" or "both":
-                L_current_pose = self.L_odom.pose.pose
-                L_current_height = L_current_pose.position.z
-            if mode =="R" or "both":
-                R_current_pose = self.R_odom.pose.pose
-                R_current_height = R_current_pose.position.z
+            L_current_height, R_current_height = self.odom.read()[:, POSITION][:, 2]
 
             if smaller_than:
                 if mode == "L":
@@ -308,6 +574,17 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
 
 
 
+    def wait_for_odom(self, stamp, timeout=0.1):
+        """Attend que les odometries des deux drones soient posterieures a stamp (en secondes de temps simulé).
+        La simulation est en pause, on attend donc en temps reel, au plus timeout secondes.
+        """
+        deadline = time.time() + timeout
+        while self.odom.read()[:, STAMP].min() < stamp:
+            if time.time() > deadline or rospy.is_shutdown():
+                rospy.logwarn("Odometry not updated after the lockstep step")
+                break
+            time.sleep(0.0005)
+
     def publish_cmd(self,name, lin_x,lin_y,lin_z, ang_z  = 0):
         cmd = Twist()
         cmd.linear.x = lin_x
@@ -315,22 +592,50 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
         cmd.linear.z = lin_z
         cmd.angular.z = ang_z
 
-        if name == "R_bebop2" or name == "both":
-            self.check_publisher(self.R_cmd_pub)
-            self.R_cmd_pub.publish(cmd)
-            rospy.logdebug("R_bebop2 cmd_vel published")
-
-        if name == "L_bebop2" or name == "both":
-            self.check_publisher(self.L_cmd_pub)
-            self.L_cmd_pub.publish(cmd)
-            rospy.logdebug("L_bebop2 cmd_vel published")
+        self.send_cmd(name, cmd)
         
         # peut etre est il nécessaire d'attendre un peu ici
-        rospy.sleep(0.03)
+        # En mode LOCKSTEP, c'est step() qui fait avancer la simulation (qui est en pause ici)
+        if self.step_mode == "REALTIME":
+            if self.scheduler is not None and self.scheduler.running:
+                self.scheduler.wait()
+            else:
+                rospy.sleep(self.control_period)
         
 
 
 
+    def send_cmd(self, name, cmd, defer=False):
+        """Publie le Twist cmd pour "L_bebop2", "R_bebop2" ou "both".
+        Avec le relais, defer=True garde la commande pour le prochain send_cmd : les commandes de L et R d'un meme
+        step partent alors dans un seul message PairCommand.
+        """
+        if not self.use_relay:
+            if name == "R_bebop2" or name == "both":
+                self.check_publisher(self.R_cmd_pub)
+                self.R_cmd_pub.publish(cmd)
+                rospy.logdebug("R_bebop2 cmd_vel published")
+
+            if name == "L_bebop2" or name == "both":
+                self.check_publisher(self.L_cmd_pub)
+                self.L_cmd_pub.publish(cmd)
+                rospy.logdebug("L_bebop2 cmd_vel published")
+            return
+
+        values = (cmd.linear.x, cmd.linear.y, cmd.linear.z, cmd.angular.z)
+        if name == "R_bebop2" or name == "both":
+            self.pair_cmd.R = values
+            self.pair_cmd.mask |= self.pair_cmd.RIGHT
+        if name == "L_bebop2" or name == "both":
+            self.pair_cmd.L = values
+            self.pair_cmd.mask |= self.pair_cmd.LEFT
+
+        if not defer:
+            self.check_publisher(self.pair_cmd_pub)
+            self.pair_cmd_pub.publish(self.pair_cmd)
+            self.pair_cmd.mask = 0
+            rospy.logdebug("pair cmd published")
+
     def do_hasardous_move(self, min_altitude = 0.5, stop_chance = 0.2):
         """Avec stop_chance %  de chance, le leader s'arrête pendant 3s
         Sinon, il choisis une action au hasard en faisant attention a ne pas passer en dessous de l'altitude 'min_altitude'
@@ -338,20 +643,20 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
 
         cmd = Twist()
         if rospy.get_rostime().to_sec() < self.stop_until:
-            self.L_cmd_pub.publish(cmd)
+            self.send_cmd("L_bebop2", cmd, defer=True)
             rospy.logwarn("3 seconds pause !")
             return
 
         if np.random.uniform(0,1,1) < stop_chance/100:
             self.stop_until = rospy.get_rostime().to_sec() + 3 
-            self.L_cmd_pub.publish(cmd)
+            self.send_cmd("L_bebop2", cmd, defer=True)
 
         else: 
             action = np.random.uniform(-1,1,3)
             cmd.linear.x = action[0]
             cmd.linear.y = action[1]
 
-            if self.L_odom.pose.pose.position.z < min_altitude and action[2] < 0:
+            if self.L_position[2] < min_altitude and action[2] < 0:
                 cmd.linear.z = 1
                 rospy.logwarn("Near to ground!")
             else:
@@ -359,26 +664,113 @@ class DoubleBebop2Env(robot_gazebo_env.RobotGazeboEnv):
 
             # cmd.angular.z = action[3]
 
-            self.L_cmd_pub.publish(cmd)
+            self.send_cmd("L_bebop2", cmd, defer=True)
 
         
 
 
+    # Trajectoire de reference pour tune_physics : (vx, vy, vz, durée en s), un carré de 0.6 m
+    REFERENCE_TRAJECTORY = ((0.3, 0.0, 0.0, 2.0), (0.0, 0.3, 0.0, 2.0), (-0.3, 0.0, 0.0, 2.0), (0.0, -0.3, 0.0, 2.0),
+                            (0.0, 0.0, 0.0, 1.0))
+
+    def tracking_error(self, trajectory=REFERENCE_TRAJECTORY):
+        """Les deux drones suivent la meme trajectoire en vitesse, simulation en marche. Les positions sont comparées,
+        a chaque periode de controle, a la reference obtenue en integrant les commandes depuis la position de depart.
+        :return: erreur de position moyenne (m) sur les deux drones
+        """
+        self.gazebo.unpauseSim()
+        start = self.odom.read()[:, POSITION].copy()
+        offset = np.zeros(3)
+        errors = []
+        for vx, vy, vz, duration in trajectory:
+            cmd = Twist()
+            cmd.linear.x, cmd.linear.y, cmd.linear.z = vx, vy, vz
+            for _ in range(int(round(duration / self.control_period))):
+                self.send_cmd("both", cmd)
+                rospy.sleep(self.control_period)
+                offset += np.array((vx, vy, vz)) * self.control_period
+                errors.append(np.linalg.norm(self.odom.read()[:, POSITION] - (start + offset), axis=1).mean())
+
+        self.send_cmd("both", Twist())
+        self.gazebo.pauseSim()
+        return float(np.mean(errors))
+
+    def tune_physics(self, tolerance=0.2, **kwargs):
+        """Choisit le max_update_rate et les iterations du solveur ODE les plus rapides dont l'erreur de suivi de
+        REFERENCE_TRAJECTORY reste a moins de tolerance (relative) du reglage d'origine, voir GazeboConnection.tune_physics.
+        Chaque essai part d'un reset().
+        """
+        def evaluate():
+            self.reset()
+            return self.tracking_error()
+
+        return self.gazebo.tune_physics(evaluate, tolerance=tolerance, **kwargs)
+
+    def reset(self):
+        # La cadence free_run repart de zero a chaque episode
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        return super(DoubleBebop2Env, self).reset()
+
     def step(self, action):
         """
         Redefinition de la fonction step por ajotuer hazardous move
         """
         rospy.logdebug("START STEP OpenAIROS")
 
-        self.gazebo.unpauseSim()
-        self.do_hasardous_move()
-        self._set_action(action)
-        self.gazebo.pauseSim()
-        obs = self._get_obs()
-        done = self._is_done(obs)
+        timer = self.step_timer
+        timer.start()
+        free_running = self.scheduler is not None and self.scheduler.free_run
+        if self.step_mode == "REALTIME" and not (free_running and self.scheduler.running):
+            self.gazebo.unpauseSim()
+            timer.lap("unpause")
+        if self.scheduler is not None:
+            self.scheduler.start()
+
+        # L'action est tenue action_repeat periodes de controle, la simulation tourne sans pause entre elles
+        self._count_step()
+        reward = 0
+        for repeat in range(self.action_repeat):
+            last_repeat = repeat == self.action_repeat - 1
+            self.do_hasardous_move()
+            timer.lap("hasardous_move")
+            self._set_action(action)
+            timer.lap("set_action")
+            if self.step_mode == "LOCKSTEP":
+                sim_time = self.gazebo.stepSim(self.lockstep_iterations)
+                timer.lap("step_world")
+                self.wait_for_odom(sim_time - self.control_period / 2)
+                timer.lap("wait_for_odom")
+            elif last_repeat and not free_running:
+                self.gazebo.pauseSim()
+                timer.lap("pause")
+            obs = self._get_obs()
+            timer.lap("get_obs")
+            done = self._is_done(obs)
+            timer.lap("is_done")
+            reward += self._compute_reward(obs, done)
+            timer.lap("compute_reward")
+            if done:
+                break
+
+        if self.step_mode == "REALTIME" and not last_repeat and not free_running:
+            # Episode fini avant la derniere repetition
+            self.gazebo.pauseSim()
+            timer.lap("pause")
+        timer.stop()
         info = {}
-        reward = self._compute_reward(obs, done)
+        if self.scheduler is not None:
+            if not free_running:
+                self.scheduler.stop()
+            info["overrun"] = self.scheduler.step_overrun
         # self.cumulated_episode_reward += reward
+        if self.action_repeat > 1:
+            info["repeats"] = repeat + 1
+        if timer.enabled:
+            info["timings"] = timer.last
+        state = self._get_state()
+        if state is not None:
+            info["state"] = state
 
         rospy.logdebug("END STEP OpenAIROS")
 
@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+import gym
+from gym.utils import seeding
+import numpy as np
+
+# Index des drones dans les tableaux d'etat
+L, R = 0, 1
+
+# Parametres de fake_driver (voir mav_train.launch)
+MAX_VEL = 3.0
+MAX_YAWRATE = 0.66
+
+
+class DoubleBebop2Kinematics(object):
+    """
+    Modele cinematique NumPy de n_pairs paires leader/follower.
+
+    Chaque drone suit la consigne de vitesse de fake_driver (cmd * max_vel, exprimee dans le
+    repere du yaw) avec un retard du premier ordre de constante de temps `tau`. Cela approxime
+    la boucle fake_driver + lee_position_controller de Gazebo sans ROS.
+
+    Les etats sont empiles : position (n, 2, 3), velocity (n, 2, 3), yaw (n, 2), cmd (n, 2, 4)
+    avec l'index 0 pour le drone L et 1 pour le drone R.
+    """
+
+    def __init__(self, n_pairs=1, tau=0.25, hover_altitude=1.0, spacing=1.0):
+        self.n_pairs = n_pairs
+        self.tau = tau
+        self.hover_altitude = hover_altitude
+        self.spacing = spacing
+
+        self.position = np.zeros((n_pairs, 2, 3))
+        self.velocity = np.zeros((n_pairs, 2, 3))
+        self.yaw = np.zeros((n_pairs, 2))
+        self.cmd = np.zeros((n_pairs, 2, 4))
+        self.time = np.zeros(n_pairs)
+
+    def reset(self, mask=slice(None)):
+        """Place les paires selectionnees (toutes par defaut) en vol stationnaire a `spacing` m l'une de l'autre"""
+        self.position[mask] = 0.0
+        self.position[mask, L, 1] = -self.spacing / 2
+        self.position[mask, R, 1] = self.spacing / 2
+        self.position[mask, :, 2] = self.hover_altitude
+        self.velocity[mask] = 0.0
+        self.yaw[mask] = 0.0
+        self.cmd[mask] = 0.0
+        self.time[mask] = 0.0
+
+    def advance(self, dt):
+        """Integre exactement le modele du premier ordre sur dt secondes"""
+        cmd = np.clip(self.cmd, -1.0, 1.0)
+        cos_yaw, sin_yaw = np.cos(self.yaw), np.sin(self.yaw)
+
+        target = np.empty_like(self.velocity)
+        target[..., 0] = cos_yaw * cmd[..., 0] - sin_yaw * cmd[..., 1]
+        target[..., 1] = sin_yaw * cmd[..., 0] + cos_yaw * cmd[..., 1]
+        target[..., 2] = cmd[..., 2]
+        target *= MAX_VEL
+
+        decay = np.exp(-dt / self.tau)
+        delta = self.velocity - target
+        self.position += target * dt + delta * self.tau * (1.0 - decay)
+        self.velocity = target + delta * decay
+
+        yaw = self.yaw + MAX_YAWRATE * cmd[..., 3] * dt
+        self.yaw = np.arctan2(np.sin(yaw), np.cos(yaw))
+
+        # Le sol arrete les drones
+        on_ground = self.position[..., 2] < 0.0
+        self.position[..., 2][on_ground] = 0.0
+        self.velocity[..., 2][on_ground] = 0.0
+
+        self.time += dt
+
+
+def hasardous_commands(np_random, time, stop_until, L_altitude, min_altitude=0.5, stop_chance=0.2):
+    """Version vectorisee de DoubleBebop2Env.do_hasardous_move.
+
+    Avec stop_chance % de chance, le leader s'arrete pendant 3s. Sinon, il choisit une action au hasard
+    en faisant attention a ne pas passer en dessous de l'altitude 'min_altitude'.
+
+    Returns:
+        (cmd, stop_until) : consignes (n, 3) du leader et nouvelles echeances de pause
+    """
+    n = len(time)
+    cmd = np_random.uniform(-1, 1, (n, 3))
+
+    near_ground = (L_altitude < min_altitude) & (cmd[:, 2] < 0)
+    cmd[near_ground, 2] = 1.0
+
+    paused = time < stop_until
+    new_pause = ~paused & (np_random.uniform(0, 1, n) < stop_chance / 100)
+    stop_until = np.where(new_pause, time + 3, stop_until)
+
+    cmd[paused | new_pause] = 0.0
+    return cmd, stop_until
+
+
+class DoubleBebop2SimEnv(gym.Env):
+    """
+    Equivalent sans ROS ni Gazebo de DoubleBebop2Env, base sur DoubleBebop2Kinematics.
+
+    Il expose les memes methodes (publish_cmd, takeoff, land, reset_pub, do_hasardous_move) et le meme
+    contrat _set_action / _get_obs / _is_done / _compute_reward pour la TaskEnv. Un step fait avancer
+    la simulation de `control_period` secondes, comme le rospy.sleep(0.03) de publish_cmd.
+    """
+
+    def __init__(self, control_period=0.03, tau=0.25):
+        self.control_period = control_period
+        self.kinematics = DoubleBebop2Kinematics(n_pairs=1, tau=tau)
+        self.stop_until = np.zeros(1)
+        self.seed()
+        self.kinematics.reset()
+
+    # Env methods
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def step(self, action):
+        self.do_hasardous_move()
+        self._set_action(action)
+        self.kinematics.advance(self.control_period)
+        obs = self._get_obs()
+        done = self._is_done(obs)
+        info = {}
+        reward = self._compute_reward(obs, done)
+
+        return obs, reward, done, info
+
+    def reset(self):
+        self._reset_sim()
+        self._init_env_variables()
+        obs = self._get_obs()
+        return obs
+
+    def _reset_sim(self):
+        self.kinematics.reset()
+        self.stop_until[:] = 0.0
+        self._set_init_pose()
+        return True
+
+    #### ETAT DES DRONES
+    @property
+    def sim_time(self):
+        return self.kinematics.time[0]
+
+    @property
+    def L_position(self):
+        return self.kinematics.position[0, L]
+
+    @property
+    def R_position(self):
+        return self.kinematics.position[0, R]
+
+    @property
+    def L_velocity(self):
+        return self.kinematics.velocity[0, L]
+
+    @property
+    def R_velocity(self):
+        return self.kinematics.velocity[0, R]
+
+    # Methods that the TrainingEnvironment will need to define here as virtual
+    # ----------------------------
+    def _set_init_pose(self):
+        """Sets the Robot in its init pose
+        """
+        raise NotImplementedError()
+
+    def _init_env_variables(self):
+        """Inits variables needed to be initialised each time we reset at the start
+        of an episode.
+        """
+        raise NotImplementedError()
+
+    def _compute_reward(self, observations, done):
+        """Calculates the reward to give based on the observations given.
+        """
+        raise NotImplementedError()
+
+    def _set_action(self, action):
+        """Applies the given action to the simulation.
+        """
+        raise NotImplementedError()
+
+    def _get_obs(self):
+        raise NotImplementedError()
+
+    def _is_done(self, observations):
+        """Checks if episode done based on observations given.
+        """
+        raise NotImplementedError()
+
+    # Methods that the TrainingEnvironment will need.
+    # ----------------------------
+    def _drone_index(self, mode):
+        assert mode in ("L", "R", "both")
+        return {"L": [L], "R": [R], "both": [L, R]}[mode]
+
+    def takeoff(self, mode = "both"):
+        """Les drones selectionnes passent directement en vol stationnaire a l'altitude de decollage"""
+        idx = self._drone_index(mode)
+        self.kinematics.position[0, idx, 2] = self.kinematics.hover_altitude
+        self.kinematics.velocity[0, idx] = 0.0
+
+    def reset_pub(self):
+        self.kinematics.cmd[0] = 0.0
+
+    def land(self, mode = "both"):
+        idx = self._drone_index(mode)
+        self.kinematics.position[0, idx, 2] = 0.0
+        self.kinematics.velocity[0, idx] = 0.0
+        self.kinematics.cmd[0, idx] = 0.0
+
+    def publish_cmd(self, name, lin_x, lin_y, lin_z, ang_z = 0):
+        cmd = (lin_x, lin_y, lin_z, ang_z)
+
+        if name == "R_bebop2" or name == "both":
+            self.kinematics.cmd[0, R] = cmd
+
+        if name == "L_bebop2" or name == "both":
+            self.kinematics.cmd[0, L] = cmd
+
+    def do_hasardous_move(self, min_altitude = 0.5, stop_chance = 0.2):
+        """Avec stop_chance %  de chance, le leader s'arrête pendant 3s
+        Sinon, il choisis une action au hasard en faisant attention a ne pas passer en dessous de l'altitude 'min_altitude'
+        """
+        cmd, self.stop_until = hasardous_commands(self.np_random, self.kinematics.time, self.stop_until,
+                                                  self.kinematics.position[:, L, 2], min_altitude, stop_chance)
+        self.kinematics.cmd[:, L, :3] = cmd
+        self.kinematics.cmd[:, L, 3] = 0.0
@@ -4,6 +4,7 @@ import gym
 from gym.utils import seeding
 from .gazebo_connection import GazeboConnection
 from .controllers_connection import ControllersConnection
+from .phase_timer import PhaseTimer
 #https://bitbucket.org/theconstructcore/theconstruct_msgs/src/master/msg/RLExperimentInfo.msg
 from openai_ros.msg import RLExperimentInfo
 import time
@@ -11,10 +12,18 @@ import time
 # https://github.com/openai/gym/blob/master/gym/core.py
 class RobotGazeboEnv(gym.Env):
 
-    def __init__(self, robot_name_space, controllers_list, reset_controls, start_init_physics_parameters=True, reset_world_or_sim="SIMULATION"):
+    def __init__(self, robot_name_space, controllers_list, reset_controls, start_init_physics_parameters=True, reset_world_or_sim="SIMULATION",
+                 profile=False, profile_dump_every=0):
+        """
+        profile: time each phase of step() and reset(). The durations of the last step are in info["timings"],
+        step_timer.summary() and reset_timer.summary() give p50/p95/p99, and profile_dump_every > 0 logs them
+        every profile_dump_every calls.
+        """
 
         # To reset Simulations
         rospy.logdebug("START init RobotGazeboEnv")
+        self.step_timer = PhaseTimer("step", enabled=profile, dump_every=profile_dump_every)
+        self.reset_timer = PhaseTimer("reset", enabled=profile, dump_every=profile_dump_every)
         self.gazebo = GazeboConnection(start_init_physics_parameters,reset_world_or_sim)
         self.controllers_object = ControllersConnection(namespace=robot_name_space, controllers_list=controllers_list)
         self.reset_controls = reset_controls
@@ -60,14 +69,25 @@ class RobotGazeboEnv(gym.Env):
         """
         rospy.logdebug("START STEP OpenAIROS")
 
+        timer = self.step_timer
+        timer.start()
         self.gazebo.unpauseSim()
+        timer.lap("unpause")
         self._set_action(action)
+        timer.lap("set_action")
         self.gazebo.pauseSim()
+        timer.lap("pause")
         obs = self._get_obs()
+        timer.lap("get_obs")
         done = self._is_done(obs)
+        timer.lap("is_done")
         info = {}
         reward = self._compute_reward(obs, done)
+        timer.lap("compute_reward")
+        timer.stop()
         # self.cumulated_episode_reward += reward
+        if timer.enabled:
+            info["timings"] = timer.last
 
         rospy.logdebug("END STEP OpenAIROS")
 
@@ -75,10 +95,16 @@ class RobotGazeboEnv(gym.Env):
 
     def reset(self):
         rospy.logdebug("Reseting RobotGazeboEnvironment")
+        timer = self.reset_timer
+        timer.start()
         self._reset_sim()
+        timer.lap("reset_sim")
         self._init_env_variables()
+        timer.lap("init_env_variables")
         # self._update_episode()
         obs = self._get_obs()
+        timer.lap("get_obs")
+        timer.stop()
         rospy.logdebug("END Reseting RobotGazeboEnvironment")
         return obs
 
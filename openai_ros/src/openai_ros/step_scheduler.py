@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+import rospy
+
+
+class StepScheduler(object):
+    """
+    Cadence fixe en temps simulé (/clock) pour les periodes de controle.
+
+    start() fixe la premiere echeance a maintenant + period, wait() dort jusqu'a l'echeance puis passe a la
+    suivante. Le temps deja consommé depuis l'echeance precedente (services pause/unpause, inference, calcul
+    des rewards...) est donc deduit du sommeil au lieu de s'y ajouter.
+
+    Si l'echeance est deja depassée, wait() ne dort pas, compte un depassement et recale la cadence sur
+    maintenant. En mode free_run, start() ne recale pas une cadence deja lancée : la simulation tourne entre
+    deux steps et le calcul de l'agent est pris sur la periode.
+    """
+
+    def __init__(self, period, free_run=False):
+        self.period = period
+        self.free_run = free_run
+        self.running = False
+        self.deadline = 0.0
+
+        # Nombre total de depassements et plus grand retard (s) depuis le dernier start()
+        self.overruns = 0
+        self.step_overrun = 0.0
+
+    def start(self):
+        self.step_overrun = 0.0
+        if self.running and self.free_run:
+            return
+        self.deadline = rospy.get_rostime().to_sec() + self.period
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def wait(self):
+        """Dort jusqu'a la prochaine echeance. :return: le retard en secondes (0 si l'echeance est tenue)"""
+        now = rospy.get_rostime().to_sec()
+        remaining = self.deadline - now
+        if remaining >= 0:
+            rospy.sleep(remaining)
+            self.deadline += self.period
+            return 0.0
+
+        self.overruns += 1
+        self.step_overrun = max(self.step_overrun, -remaining)
+        rospy.logwarn(f"Control period overrun by {-1000 * remaining:.1f} ms ({self.overruns} overruns)")
+        self.deadline = now + self.period
+        return -remaining
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+"""
+Observation, termination and reward rules of the leader/follower task that do
+not depend on ROS. They are shared by DoubleBebop2TaskEnv (Gazebo) and
+DoubleBebop2SimTaskEnv (NumPy stand-in simulator).
+
+Every function works on a single observation of shape (3,) as well as on a
+batch of observations of shape (N, 3). full_observation builds the richer
+17-dim observation (OBSERVATION_COLUMNS) the same way, from the odometry of
+one pair (2, ODOM_SIZE) or of many pairs (N, 2, ODOM_SIZE).
+
+The termination and reward rules themselves are NumPy expressions written in
+config/double_bebop2_rewards.yaml and evaluated by RewardEngine.
+"""
+import os
+import numpy as np
+import yaml
+
+MAX_STEP = 1000 # Can be any Value
+
+REWARD_SPEC = os.path.join(os.path.dirname(__file__), "config", "double_bebop2_rewards.yaml")
+
+# Colonnes des observations, 3 (distance relative) ou 17 dimensions (+ vitesses et angles d'Euler des drones)
+OBSERVATION_COLUMNS = ("dist_x", "dist_y", "dist_z",
+                       "L_vx", "L_vy", "L_vz", "L_az", "R_vx", "R_vy", "R_vz", "R_az",
+                       "L_roll", "L_pitch", "L_yaw", "R_roll", "R_pitch", "R_yaw")
+
+# Etat complet d'un pas, renvoyé dans info["state"] par DoubleBebop2TaskEnv et gardé par le replay buffer de SAC
+# pour relabel_rewards.py : odometries synchronisées des deux drones (2 x ODOM_SIZE, disposition de
+# double_bebop2_env.OdometryBuffer : stamp, position, orientation, vitesses) puis numero du pas
+ODOM_SIZE = 14
+ALTITUDE = 3
+STATE_SIZE = 2 * ODOM_SIZE + 1
+_POSITION, _ORIENTATION, _LINEAR, _ANGULAR_Z = slice(1, 4), slice(4, 8), slice(8, 11), 13
+
+EXPRESSION_FUNCTIONS = {"where": np.where, "abs": np.abs, "sqrt": np.sqrt, "hypot": np.hypot,
+                        "minimum": np.minimum, "maximum": np.maximum, "clip": np.clip}
+
+
+def relative_distance(L_position, R_position):
+    """Absolute distance between the drones along x, y and z"""
+    return np.abs(np.asarray(L_position) - np.asarray(R_position))
+
+
+def wrap_angle(angle):
+    """Angle(s) ramenés dans [-pi, pi]"""
+    return np.arctan2(np.sin(angle), np.cos(angle))
+
+
+def quaternion_to_euler(quaternions, out=None):
+    """
+    Quaternions (..., 4) en (x, y, z, w) -> roll, pitch, yaw (..., 3), axes fixes x, y, z comme
+    tf.transformations.euler_from_quaternion, pour tout un batch a la fois. Roll et yaw viennent de arctan2 et
+    sont donc deja dans [-pi, pi].
+    """
+    q = np.asarray(quaternions, dtype=np.float64)
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    if out is None:
+        out = np.empty(q.shape[:-1] + (3,))
+
+    out[..., 0] = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    out[..., 1] = np.arcsin(np.clip(2 * (w * y - z * x), -1.0, 1.0))
+    out[..., 2] = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return out
+
+
+def full_observation(odom):
+    """
+    Odometries (..., 2, ODOM_SIZE) -> observations (..., 17) dans l'ordre de OBSERVATION_COLUMNS : distance
+    relative, vitesses lineaires et vitesse de lacet de L puis R, roll/pitch/yaw de L puis R (yaw dans [-pi, pi])
+    """
+    odom = np.asarray(odom, dtype=np.float64)
+    observation = np.empty(odom.shape[:-2] + (len(OBSERVATION_COLUMNS),))
+    np.abs(odom[..., 0, _POSITION] - odom[..., 1, _POSITION], out=observation[..., 0:3])
+    observation[..., 3:6] = odom[..., 0, _LINEAR]
+    observation[..., 6] = odom[..., 0, _ANGULAR_Z]
+    observation[..., 7:10] = odom[..., 1, _LINEAR]
+    observation[..., 10] = odom[..., 1, _ANGULAR_Z]
+    quaternion_to_euler(odom[..., 0, _ORIENTATION], out=observation[..., 11:14])
+    quaternion_to_euler(odom[..., 1, _ORIENTATION], out=observation[..., 14:17])
+    return observation
+
+
+def pack_state(odom, number_step):
+    """Odometries (2, ODOM_SIZE) et numero du pas -> vecteur de STATE_SIZE"""
+    return np.append(np.ravel(odom), number_step)
+
+
+def unpack_state(states):
+    """Etats (..., STATE_SIZE) -> odometries (..., 2, ODOM_SIZE), numeros des pas (...)"""
+    states = np.asarray(states)
+    return states[..., :-1].reshape(states.shape[:-1] + (2, ODOM_SIZE)), states[..., -1]
+
+
+class RewardEngine(object):
+    """
+    Regles de fin d'episode et reward_system choisi, lus dans un fichier YAML (REWARD_SPEC par defaut) et
+    evalués comme expressions NumPy sur une observation ou un batch d'observations. Le meme code sert aux
+    envs Gazebo, a la simulation NumPy vectorisée et a l'analyse hors ligne.
+
+    load() relit le fichier seulement s'il a changé : les envs l'appellent une fois par episode.
+    """
+
+    def __init__(self, reward_system="reward_system0bis", path=REWARD_SPEC):
+        self.reward_system = reward_system
+        self.path = path
+        self._mtime = None
+        self._overrides = {}
+        self.load()
+
+    @staticmethod
+    def available(path=REWARD_SPEC):
+        """Noms des reward systems du fichier"""
+        with open(path) as f:
+            return list(yaml.safe_load(f)["reward_systems"])
+
+    def load(self, overrides=None):
+        """
+        (Re)charge la spec si le fichier a changé ou si overrides ({param: valeur}, remplace les params du
+        fichier pour la terminaison comme pour le reward system) est différent du precedent.
+        """
+        overrides = dict(overrides or {})
+        mtime = os.path.getmtime(self.path)
+        if mtime == self._mtime and overrides == self._overrides:
+            return
+        self._mtime, self._overrides = mtime, overrides
+
+        with open(self.path) as f:
+            spec = yaml.safe_load(f)
+        if self.reward_system not in spec["reward_systems"]:
+            raise KeyError(f"{self.reward_system} is not in {self.path}, available : {list(spec['reward_systems'])}")
+        termination = spec["termination"]
+        system = spec["reward_systems"][self.reward_system]
+
+        self.termination_params = self._params(termination, overrides)
+        self.reward_params = self._params(system, overrides)
+        self._done = self._compile(termination["done"], "termination.done")
+        self._end = self._compile(system["end"], self.reward_system + ".end")
+        self._step = self._compile(system["step"], self.reward_system + ".step")
+
+    @staticmethod
+    def _params(block, overrides):
+        params = {name: float(value) for name, value in block.get("params", {}).items()}
+        params.update({name: float(value) for name, value in overrides.items() if name in params})
+        return params
+
+    @staticmethod
+    def _compile(expression, name):
+        # Les parentheses autorisent les retours a la ligne du YAML
+        return compile("(" + expression + ")", name, "eval")
+
+    def variables(self, observations, L_altitude=np.inf, R_altitude=np.inf, number_step=0):
+        """Noms disponibles dans les expressions pour ce batch d'observations"""
+        observations = np.asarray(observations, dtype=np.float64)
+        names = dict(zip(OBSERVATION_COLUMNS, np.moveaxis(observations, -1, 0)))
+        names["distance"] = np.hypot(names["dist_x"], names["dist_y"])
+        if "R_yaw" in names:
+            names["yaw_error"] = np.abs(names["L_yaw"] - names["R_yaw"])
+        names["L_altitude"] = np.asarray(L_altitude)
+        names["R_altitude"] = np.asarray(R_altitude)
+        names["number_step"] = np.asarray(number_step)
+        return names
+
+    def _eval(self, code, params, names):
+        namespace = dict(EXPRESSION_FUNCTIONS)
+        namespace.update(params)
+        namespace.update(names)
+        try:
+            return eval(code, {"__builtins__": {}}, namespace)
+        except NameError as e:
+            raise ValueError(f"{code.co_filename} : {e} (not available with these observations)") from None
+
+    def is_done(self, observations, L_altitude, R_altitude, names=None):
+        names = names if names is not None else self.variables(observations, L_altitude, R_altitude)
+        return np.asarray(self._eval(self._done, self.termination_params, names), dtype=bool)
+
+    def reward(self, observations, done, number_step=0, names=None):
+        names = names if names is not None else self.variables(observations, number_step=number_step)
+        end = self._eval(self._end, self.reward_params, names)
+        step = self._eval(self._step, self.reward_params, names)
+        return np.where(done, end, step).astype(np.float64)
+
+    def evaluate(self, observations, L_altitude, R_altitude, number_step=0):
+        """:return: (rewards, dones) pour un batch, les variables ne sont calculées qu'une fois"""
+        names = self.variables(observations, L_altitude, R_altitude, number_step)
+        done = self.is_done(observations, L_altitude, R_altitude, names)
+        return self.reward(observations, done, number_step, names), done
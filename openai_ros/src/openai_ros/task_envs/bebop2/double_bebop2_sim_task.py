@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+from gym import spaces
+from gym.envs.registration import register
+from gym.utils import seeding
+import numpy as np
+from openai_ros.robot_envs import double_bebop2_sim_env
+from openai_ros.robot_envs.double_bebop2_sim_env import L, R
+from openai_ros.task_envs.bebop2 import double_bebop2_common
+from openai_ros.task_envs.bebop2.double_bebop2_common import MAX_STEP
+
+# Meme tache que DoubleBebop2Env-v0, mais simulee en NumPy : ni ROS master ni Gazebo
+register(
+        id='DoubleBebop2SimEnv-v0',
+        entry_point='openai_ros.task_envs.bebop2.double_bebop2_sim_task:DoubleBebop2SimTaskEnv',
+        max_episode_steps=MAX_STEP,
+    )
+
+class DoubleBebop2SimTaskEnv(double_bebop2_sim_env.DoubleBebop2SimEnv):
+    def __init__(self, control_period=0.03, tau=0.25, reward_system="reward_system0bis"):
+
+        self.rewards = double_bebop2_common.RewardEngine(reward_system)
+        super(DoubleBebop2SimTaskEnv, self).__init__(control_period=control_period, tau=tau)
+
+        self.observation_space = spaces.Box(low = np.array([-30,-30,-30]), high = np.array([30,30,30]), dtype = np.float32)
+        self.action_space = spaces.Box(low = np.array([-1,-1,-1]), high = np.array([1,1,1]), dtype = np.float32)
+        self.number_step = 0
+
+
+    def _set_init_pose(self):
+        """Sets the Robot in its init pose
+        """
+        self.publish_cmd("both", 0,0,0,0)
+
+
+    def _init_env_variables(self):
+        """
+        Inits variables needed to be initialised each time we reset at the start
+        of an episode.
+        """
+        self.reset_pub()
+        self.takeoff()
+        self.number_step = 0
+        self.rewards.load()
+
+
+    def _set_action(self, action):
+        """
+        On fait bouger le R_bebop qui suit le L_bebop
+        action = [linear.x, linear.y, linear.z]
+        """
+        lin_x, lin_y, lin_z = action
+        self.publish_cmd("R_bebop2",lin_x,lin_y,lin_z)
+        self.number_step += 1
+
+
+    def _get_obs(self):
+        """
+        Obsevations : distance between drones obs[0...2]
+        """
+        return double_bebop2_common.relative_distance(self.L_position, self.R_position)
+
+
+    def _is_done(self, observations):
+        done = self.rewards.is_done(observations, self.L_position[2], self.R_position[2])
+        return bool(done)
+
+
+    def _compute_reward(self, observations, done):
+        return float(self.rewards.reward(observations, done, number_step=self.number_step))
+
+
+class DoubleBebop2SimVecEnv(object):
+    """
+    N paires leader/follower simulees en meme temps par un seul DoubleBebop2Kinematics.
+
+    step(actions[N, 3]) renvoie obs[N, 3], rewards[N], dones[N], info. Les paires terminees
+    (ou arrivees a max_episode_steps) sont remises a zero automatiquement : leur observation
+    renvoyee est celle du nouvel episode, la derniere observation de l'episode fini est dans
+    info["terminal_observation"] et info["truncated"] indique les fins dues a la limite de temps.
+    """
+
+    def __init__(self, num_envs=8, control_period=0.03, tau=0.25, max_episode_steps=MAX_STEP,
+                 reward_system="reward_system0bis"):
+        self.num_envs = num_envs
+        self.rewards = double_bebop2_common.RewardEngine(reward_system)
+        self.control_period = control_period
+        self.max_episode_steps = max_episode_steps
+        self.kinematics = double_bebop2_sim_env.DoubleBebop2Kinematics(n_pairs=num_envs, tau=tau)
+
+        self.stop_until = np.zeros(num_envs)
+        self.number_step = np.zeros(num_envs, dtype=np.int64)
+
+        self.observation_space = spaces.Box(low = np.array([-30,-30,-30]), high = np.array([30,30,30]), dtype = np.float32)
+        self.action_space = spaces.Box(low = np.array([-1,-1,-1]), high = np.array([1,1,1]), dtype = np.float32)
+        self.seed()
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    def reset(self):
+        self.rewards.load()
+        self._reset_pairs(slice(None))
+        return self._get_obs()
+
+    def step(self, actions):
+        actions = np.asarray(actions).reshape(self.num_envs, 3)
+        kin = self.kinematics
+
+        L_cmd, self.stop_until = double_bebop2_sim_env.hasardous_commands(
+            self.np_random, kin.time, self.stop_until, kin.position[:, L, 2])
+        kin.cmd[:, L, :3] = L_cmd
+        kin.cmd[:, R, :3] = actions
+        kin.cmd[:, :, 3] = 0.0
+        kin.advance(self.control_period)
+        self.number_step += 1
+
+        obs = self._get_obs()
+        rewards, dones = self.rewards.evaluate(obs, kin.position[:, L, 2], kin.position[:, R, 2], self.number_step)
+
+        truncated = ~dones & (self.number_step >= self.max_episode_steps)
+        dones = dones | truncated
+        info = {}
+        if dones.any():
+            info["terminal_observation"] = obs.copy()
+            info["truncated"] = truncated
+            self._reset_pairs(dones)
+            obs[dones] = self._get_obs()[dones]
+
+        return obs, rewards, dones, info
+
+    def close(self):
+        pass
+
+    def _reset_pairs(self, mask):
+        self.kinematics.reset(mask)
+        self.stop_until[mask] = 0.0
+        self.number_step[mask] = 0
+
+    def _get_obs(self):
+        return double_bebop2_common.relative_distance(self.kinematics.position[:, L], self.kinematics.position[:, R])
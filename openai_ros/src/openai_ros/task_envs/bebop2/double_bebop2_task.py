@@ -1,20 +1,20 @@
 #!/usr/bin/env python
 from gym import spaces
 from openai_ros.robot_envs import double_bebop2_env
+from openai_ros.robot_envs.double_bebop2_env import L, R, STAMP, POSITION, LINEAR
 from openai_ros.openai_ros_common import ROSLauncher
 from gym.envs.registration import register
 from openai_ros.task_envs.task_commons import LoadYamlFileParamsTest
 import rospy
 from geometry_msgs.msg import Vector3, Pose
 from nav_msgs.msg import Odometry
-from tf.transformations import euler_from_quaternion
 import time
 import numpy as np
 from pathlib import Path
-import math
+from openai_ros.task_envs.bebop2 import double_bebop2_common
+from openai_ros.task_envs.bebop2.double_bebop2_common import MAX_STEP
 
 # The path is __init__.py of openai_ros, where we import the MovingCubeOneDiskWalkEnv directly
-MAX_STEP = 1000 # Can be any Value
 
 register(
         id='DoubleBebop2Env-v0',
@@ -23,19 +23,55 @@ register(
     )
 
 class DoubleBebop2TaskEnv(double_bebop2_env.DoubleBebop2Env):
-    def __init__(self):
-
+    def __init__(self, step_mode="REALTIME", lockstep_iterations=None, reset_mode="TAKEOFF", launch_args=(),
+                 profile=False, profile_dump_every=0, use_relay=False, action_repeat=1, fixed_rate=False, free_run=False,
+                 physics_tolerance=None, reward_system="reward_system0bis", observation="DISTANCE"):
+        """
+        Args:
+            launch_args (list, optional): arguments de mav_train.launch, par exemple ["gui:=false"] ou ["headless:=true"] (gzserver seul, sans camera ni IMU).
+            profile, profile_dump_every: chronometrage de step() et reset(), voir DoubleBebop2Env.
+            use_relay (bool, optional): lance et utilise le noeud pair_relay, voir DoubleBebop2Env. Defaults to False.
+            action_repeat (int, optional): periodes de controle par action, voir DoubleBebop2Env. Defaults to 1.
+            fixed_rate, free_run: cadence fixe des periodes de controle en temps simulé, voir DoubleBebop2Env.
+            physics_tolerance (float, optional): si donné, tune_physics choisit au demarrage le reglage de gazebo le
+                plus rapide dont l'erreur de suivi reste a moins de cette tolerance relative. Defaults to None.
+            reward_system (str, optional): reward system de config/double_bebop2_rewards.yaml. Ses params (et ceux de
+                la terminaison) peuvent etre remplacés par le parametre ROS /double_bebop2/reward_params, lu une fois
+                par episode. Defaults to "reward_system0bis".
+            observation (str, optional): "DISTANCE" : distance relative des drones (3). "FULL" : distance relative,
+                vitesses et angles d'Euler des deux drones (17, voir double_bebop2_common.OBSERVATION_COLUMNS), a
+                utiliser avec reward_system1, 2 ou 3. Defaults to "DISTANCE".
+            reset_mode (str, optional): "TAKEOFF" : les drones redecollent a chaque episode. "TELEPORT" : ils sont
+                places directement en vol stationnaire a 1 m l'un de l'autre (set_model_state). "SNAPSHOT" : l'etat
+                apres le premier decollage stable (poses, vitesses) est enregistré puis restauré a chaque reset.
+                Defaults to "TAKEOFF".
+        """
+        assert reset_mode in ("TAKEOFF", "TELEPORT", "SNAPSHOT")
+        self.reset_mode = reset_mode
+        assert observation in ("DISTANCE", "FULL")
+        self.observation = observation
+        self.rewards = double_bebop2_common.RewardEngine(reward_system)
+        # Durée (temps reel, en secondes) du dernier _init_env_variables
+        self.last_reset_latency = 0.0
 
         # Lancement de la simulation
         ROSLauncher(rospackage_name="rotors_gazebo", launch_file_name="mav_train.launch", 
-                    ros_ws_abspath=str(Path(__file__).parent.parent.parent.parent.parent.parent.parent))
+                    ros_ws_abspath=str(Path(__file__).parent.parent.parent.parent.parent.parent.parent),
+                    launch_args=list(launch_args) + (["relay:=true"] if use_relay else []))
         
         # On charge methodes et atributs de la classe mere
-        super(DoubleBebop2TaskEnv, self).__init__()
+        super(DoubleBebop2TaskEnv, self).__init__(step_mode=step_mode, lockstep_iterations=lockstep_iterations,
+                                                  profile=profile, profile_dump_every=profile_dump_every,
+                                                  use_relay=use_relay, action_repeat=action_repeat,
+                                                  fixed_rate=fixed_rate, free_run=free_run)
 
-        self.observation_space = spaces.Box(low = np.array([-30,-30,-30]), high = np.array([30,30,30]), dtype = np.float32)
+        obs_size = 3 if observation == "DISTANCE" else len(double_bebop2_common.OBSERVATION_COLUMNS)
+        self.observation_space = spaces.Box(low = np.full(obs_size, -30), high = np.full(obs_size, 30), dtype = np.float32)
         self.action_space = spaces.Box(low = np.array([-1,-1,-1]), high = np.array([1,1,1]), dtype = np.float32)
 
+        if physics_tolerance is not None:
+            self.tune_physics(tolerance=physics_tolerance)
+
 
 
     def _set_init_pose(self):
@@ -57,8 +93,31 @@ class DoubleBebop2TaskEnv(double_bebop2_env.DoubleBebop2Env):
         of an episode.
         :return:
         """
+        start = time.time()
+
+        if self.reset_mode == "TELEPORT":
+            done = self._teleport_reset()
+        elif self.reset_mode == "SNAPSHOT":
+            done = self.hover_snapshot is not None and self._snapshot_reset()
+        else:
+            done = False
 
+        if not done:
+            self._takeoff_reset()
+            # Le premier decollage stable sert de snapshot pour les resets suivants
+            if self.reset_mode == "SNAPSHOT" and self.hover_snapshot is None:
+                self._capture_snapshot()
 
+        # Seul appel au parameter server pour les rewards, le fichier n'est relu que s'il a changé
+        self.rewards.load(rospy.get_param("/double_bebop2/reward_params", {}))
+
+        self.last_reset_latency = time.time() - start
+        rospy.loginfo(f"Reset ({self.reset_mode}) : {1000 * self.last_reset_latency:.0f} ms")
+        self.number_step = 0
+
+
+    def _takeoff_reset(self):
+        """Les drones sont reposés au sol (reset_pub) puis redecollent"""
         self.reset_pub()
         rospy.sleep(0.1)
         self.gazebo.unpauseSim()
@@ -67,11 +126,10 @@ class DoubleBebop2TaskEnv(double_bebop2_env.DoubleBebop2Env):
         while True:
             rospy.sleep(0.1)
             self.takeoff()
-            L_alt = self.L_odom.pose.pose.position.z
-            R_alt = self.R_odom.pose.pose.position.z
-            dist_x = abs(self.L_odom.pose.pose.position.x - self.R_odom.pose.pose.position.x)
-            dist_y = abs(self.L_odom.pose.pose.position.y - self.R_odom.pose.pose.position.y)
-            dist_z = abs(L_alt - R_alt) 
+            odom = self.odom.read()
+            L_alt = odom[L, POSITION][2]
+            R_alt = odom[R, POSITION][2]
+            dist_x, dist_y, dist_z = double_bebop2_common.relative_distance(odom[L, POSITION], odom[R, POSITION])
 
             distance =  self.compute_dist(dist_x, dist_y, dist_z) 
             if distance >1.02 or L_alt < 0.25 or R_alt < 0.25:
@@ -86,7 +144,77 @@ class DoubleBebop2TaskEnv(double_bebop2_env.DoubleBebop2Env):
                 break
 
         self.gazebo.pauseSim()
-        self.number_step = 0
+
+
+    def _teleport_reset(self, timeout=2.0):
+        """
+        Place les deux drones en vol stationnaire a 1 m l'un de l'autre, puis attend (sans sleep fixe)
+        une odometrie posterieure au teleport qui montre les deux drones stables.
+        :return: False si les drones ne sont pas stables apres timeout secondes
+        """
+        return self._place_and_wait(lambda: self.teleport(L_position=(0.0, -0.5, 1.0), R_position=(0.0, 0.5, 1.0)),
+                                    timeout)
+
+    def _snapshot_reset(self, timeout=2.0):
+        """
+        Restaure l'etat de vol stationnaire enregistré apres le premier decollage (poses et vitesses des deux
+        drones, consigne de fake_driver), puis attend que les drones soient stables comme pour TELEPORT.
+        :return: False si les drones ne sont pas stables apres timeout secondes
+        """
+        return self._place_and_wait(self.restore_hover, timeout)
+
+    def _capture_snapshot(self, timeout=5.0):
+        """
+        Apres un decollage, laisse les drones se stabiliser (ils peuvent encore monter a la sortie de
+        _takeoff_reset) puis enregistre le snapshot. Sinon les resets suivants redecollent et on reessaie.
+        """
+        self.gazebo.unpauseSim()
+        if not self._wait_hovering(rospy.get_rostime().to_sec(), timeout):
+            rospy.logwarn(f"Drones not hovering {timeout} s after takeoff, no snapshot taken")
+        elif not self.snapshot_hover():
+            rospy.logwarn("Could not read the drones model states, no snapshot taken")
+
+    def _place_and_wait(self, place, timeout):
+        """Appelle place() simulation en pause puis attend une odometrie posterieure qui montre les drones stables"""
+        self.gazebo.pauseSim()
+        teleport_stamp = rospy.get_rostime().to_sec()
+        place()
+        self.gazebo.unpauseSim()
+
+        if self._wait_hovering(teleport_stamp, timeout):
+            return True
+        rospy.logerr(f"{self.reset_mode} reset failed, falling back to takeoff")
+        return False
+
+    def _wait_hovering(self, stamp, timeout):
+        """Simulation en marche, attend (sans sleep fixe) que _is_hovering(stamp) soit vrai puis met en pause.
+        :return: False si les drones ne sont pas stables apres timeout secondes
+        """
+        hovering = False
+        deadline = time.time() + timeout
+        while not rospy.is_shutdown():
+            if self._is_hovering(stamp):
+                hovering = True
+                break
+            if time.time() > deadline:
+                break
+            rospy.sleep(0.001)
+
+        self.gazebo.pauseSim()
+        return hovering
+
+    def _is_hovering(self, stamp):
+        """Vrai si les odometries des deux drones sont posterieures a stamp et que les drones sont
+        stables, a 1 m l'un de l'autre"""
+        odom = self.odom.read()
+        if odom[:, STAMP].min() <= stamp:
+            return False
+
+        distance = self.compute_dist(*(odom[L, POSITION] - odom[R, POSITION]))
+        altitudes = odom[:, POSITION][:, 2]
+        speeds = np.linalg.norm(odom[:, LINEAR], axis=1)
+
+        return abs(distance - 1) < 0.02 and altitudes.min() > 0.9 and speeds.max() < 0.1
 
 
     def _set_action(self, action):
@@ -98,6 +226,10 @@ class DoubleBebop2TaskEnv(double_bebop2_env.DoubleBebop2Env):
         """
         lin_x, lin_y, lin_z = action
         self.publish_cmd("R_bebop2",lin_x,lin_y,lin_z)
+
+
+    def _count_step(self):
+        """Un pas par decision de l'agent : les limites d'episode ne dependent pas de action_repeat"""
         self.number_step += 1
         
 
@@ -105,25 +237,30 @@ class DoubleBebop2TaskEnv(double_bebop2_env.DoubleBebop2Env):
         """
         Obsevations : 
         -   distance between drones obs[0...2]
-        -   L drone speed, R drone speed : obs[3...6], obs[6...9] 
-        -   Euler orientaiton of both drones
+        -   observation "FULL" : L drone speed, R drone speed (lineaire et lacet) : obs[3...6], obs[7...10]
+        -   observation "FULL" : Euler orientaiton of both drones : obs[11...13], obs[14...16]
 
         """
-        # Distance
-        dist_x = abs(self.L_odom.pose.pose.position.x - self.R_odom.pose.pose.position.x)
-        dist_y = abs(self.L_odom.pose.pose.position.y - self.R_odom.pose.pose.position.y)
-        dist_z = abs(self.L_odom.pose.pose.position.z - self.R_odom.pose.pose.position.z)
-
+        # Les deux drones au meme instant simulé, une seule lecture reutilisée par _is_done
+        self.obs_odom = self.odom.read_synchronized()
 
+        if self.observation == "FULL":
+            return double_bebop2_common.full_observation(self.obs_odom)
 
-        observation = np.array([dist_x, dist_y, dist_z])
+        # Distance
+        observation = double_bebop2_common.relative_distance(self.obs_odom[L, POSITION], self.obs_odom[R, POSITION])
         return  observation
     
 
 
 
+    def _get_state(self):
+        """Odometries synchronisées du dernier _get_obs et numero du pas, voir double_bebop2_common.pack_state"""
+        return double_bebop2_common.pack_state(self.obs_odom, self.number_step)
+
+
     def wrap_angle(self, angle):
-        return math.atan2(math.sin(angle), math.cos(angle))
+        return double_bebop2_common.wrap_angle(angle)
 
 
 
@@ -158,16 +295,9 @@ class DoubleBebop2TaskEnv(double_bebop2_env.DoubleBebop2Env):
         
 
         # Check the distance between the drone
-        dist_x, dist_y, dist_z = observations[0:3]
-        # distance = self.compute_dist(dist_x, dist_y)
-
-        # if distance > 1.5 or distance < 0.5: done = True
-        if dist_x > 0.2: done = True
-        if dist_y > 1.5: done = True
-        if dist_y < 0.5: done = True
-        if dist_z > 0.2: done = True
-        # if yaw_error > 0.53 : done = True # ~ 30 degrees 
-        if self.L_odom.pose.pose.position.z < 0.2 or self.R_odom.pose.pose.position.z < 0.2 : done = True
+        # if yaw_error > 0.53 : done = True # ~ 30 degrees
+        if self.rewards.is_done(observations, self.obs_odom[L, POSITION][2], self.obs_odom[R, POSITION][2]):
+            done = True
 
         return done
     
@@ -177,8 +307,8 @@ class DoubleBebop2TaskEnv(double_bebop2_env.DoubleBebop2Env):
             Par la suite on voudra aussi que le drones esquives les obstacles (pas pour l'instant)
         On utilisera une reward linéiar en fonction de la distance entre les drones
         """
-        # System rewards 1 2 ou 3 
-        reward = self.reward_system0bis(observations, done)
+        # Reward system choisi a la construction (0, 0bis, 1, 2 ou 3), voir config/double_bebop2_rewards.yaml
+        reward = float(self.rewards.reward(observations, done, number_step=self.number_step))
         return reward
         
     # Internal TaskEnv Methods
@@ -197,243 +327,5 @@ class DoubleBebop2TaskEnv(double_bebop2_env.DoubleBebop2Env):
                             quaternion_vector.z,
                             quaternion_vector.w]
 
-        roll, pitch, yaw = euler_from_quaternion(orientation_list)
+        roll, pitch, yaw = double_bebop2_common.quaternion_to_euler(orientation_list)
         return roll, pitch, yaw
-
-
-##### REWARD SYSTEM : 
-    def reward_system0(self, observations, done): 
-
-        dist_x, dist_y, dist_z = observations[0:3]
-        distance = self.compute_dist(dist_x, dist_y)
-        reward = 0
-
-        if done : 
-            if distance > 2: 
-                reward = rospy.get_param("overdist_reward",-350)
-            if distance < 0.6:
-                reward = rospy.get_param("near_distance_end", -350)
-            elif dist_z > 0.2:
-                reward = rospy.get_param("overalt_reward",-100)
-            
-        if not done: 
-            if (1 - distance)  > 0.15:
-                reward  = rospy.get_param("good_reward", 15)
-            elif distance < 0.65: 
-                reward =  rospy.get_param("near_reward",-30)
-            
-            # Encouraging number of step
-            reward +=2
-        
-        return reward
-        
-    def reward_system0bis(self, observations, done): 
-
-        dist_x, dist_y, dist_z = observations[0:3]
-        if done : 
-            if dist_x >=0.2:
-                reward = -200
-            
-            if dist_y >= 1.5:
-                reward = -300
-            elif dist_y <= 0.5:
-                reward = -300
-            
-            if dist_z >= 0.2:
-                reward = -300
-        
-        else:
-            reward = 0
-            if dist_x < 0.1:
-                reward  += 2
-
-            if abs(dist_y - 1) < 0.1:
-                reward += 4
-
-            if dist_z < 0.1:
-                reward += 2
-        
-        return reward
-
-
-
-
-    def reward_system1(self, observations, done):
-        L_roll = observations[11]
-        L_pitch = observations[12]
-
-        R_roll = observations[14]
-        R_pitch = observations[15]
-
-        dist_x, dist_y, dist_z = observations[0:3]
-        distance = self.compute_dist(dist_x, dist_y)
-        reward = 0
-
-        if not done: 
-            if abs(1 - distance) < 0.1: 
-                reward += 10
-            elif distance > 1:
-                #Pourcentage
-                reward += -100*(distance - 1)/0.5
-                # assert reward <= 0
-                
-            elif distance < 1:
-                # Pourcentage 
-                reward += -300*(distance - 0.5)/0.5
-                # assert reward <= 0
-
-            if dist_z > 0.1:
-                reward -= 300 
-            else: reward +=30
-
-            # if self.L_pose.position.z < 0.2 or self.R_pose.position.z < 0.2 :
-            #     reward -= 30
-            # else:
-            #     reward += 3
-
-        
-        else:
-            if distance < 0.5:
-                # Si l'episode se termine acvec les drones trop proche (pret a se cogner)
-                reward += -500
-            elif distance > 1.5:
-                # Si les drones se sont trop éloigné
-                reward += -200
-            else:
-                reward += 10
-            
-            if dist_z > 0.1:
-                reward -= 300 
-            else: reward +=30
-            
-
-            if abs(L_pitch) >= 1.57 or abs(L_roll) >= 1.57 or abs(R_pitch) >= 1.57 or abs(R_roll) >= 1.57:
-                reward += -500
-            else: 
-                reward += 10
-
-            
-            if self.number_step >= MAX_STEP:
-                #Dans ce cas on aura fini l'épiosde sans acro
-                reward += 1000
-        return reward
-    
-    def reward_system2(self, observations, done):
-
-        #end episode
-        out_reward = -150
-        too_near_reward = -200
-        total_bad_altitude_reward = -150
-        good_yaw = 15
-        bad_yaw = -20
-        good_distance_reward = 20
-        good_altitude_reward = 20
-        bad_distance_reward = -40
-        bad_altitude_reward = -40
-        step_reward = 5
-
-
-        dist_x, dist_y, dist_z = observations[0:3]
-        L_yaw, R_yaw = observations[13], observations[16]
-        
-        yaw_error = abs(L_yaw-R_yaw)
-
-        distance = self.compute_dist(dist_x, dist_y)
-        if done :
-            reward = 0
-            if distance > 1.5:
-                reward += out_reward
-            if distance < 0.5:
-                reward += too_near_reward
-            if dist_z > 0.2:
-                reward += total_bad_altitude_reward
-            return reward
-
-        else:
-            reward = 0
-            if abs(distance -1 ) < 0.1:
-                reward += good_distance_reward
-            else : 
-                reward += bad_distance_reward
-            if dist_z < 0.1: 
-                reward += good_altitude_reward
-            else:
-                reward += bad_altitude_reward
-
-            if yaw_error < 0.2 : # ~11 degrees
-                reward += good_yaw
-            else:
-                reward += bad_yaw
-
-            reward += step_reward
-            return reward
-
-    def reward_system3(self, observations, done):
-        # Ah ouai ?
-        out_reward = -400
-        too_near_reward = -500
-        total_bad_altitude_reward = -350
-        good_yaw = 5
-        bad_yaw = -10
-        good_distance_reward = 10
-        good_altitude_reward = 10
-        step_reward = 3
-
-        speed_penalty = -50
-
-
-        dist_x, dist_y, dist_z = observations[0:3]
-        Lvx, Lvy, Lvz, Laz, Rvx, Rvy, Rvz, Raz = observations[3:11]
-        L_yaw, R_yaw = observations[13], observations[16]
-        
-        yaw_error = abs(L_yaw-R_yaw)
-
-        distance = self.compute_dist(dist_x, dist_y)
-        if done :
-            reward = 0
-            if distance > 1.5:
-                reward += out_reward
-            if distance < 0.5:
-                reward += too_near_reward
-            if dist_z >= 0.2:
-                reward += total_bad_altitude_reward
-            return reward
-
-        else:
-            reward = 0
-            if abs(distance -1 ) < 0.15:
-                reward += good_distance_reward
-
-            if dist_z < 0.1: 
-                reward += good_altitude_reward
-
-            if yaw_error < 0.2 : # ~11 degrees
-                reward += good_yaw
-            else:
-                reward += bad_yaw
-            
-            # Il faut que les vitesses soient les memes (les drones vont au meme endroit) (sauf si ils sont trop proche)
-            if distance > 0.8: 
-                if Lvx*Rvx < 0  and abs(Lvx - Rvx) > 0.05:
-                    reward += speed_penalty
-
-                if Lvy*Rvy < 0  and abs(Lvy - Rvy) > 0.05:
-                    reward += speed_penalty
-
-                if Lvz*Rvz < 0  and abs(Lvz - Rvz) > 0.05:
-                    reward += speed_penalty
-
-                if Laz*Raz < 0  and abs(Laz - Raz) > 0.05:
-                    reward += speed_penalty
-
-            reward += step_reward
-            return reward
-
-
-            
-            
-            
-
-
-
-
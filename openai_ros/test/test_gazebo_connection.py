@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""
+Etat de pause suivi par GazeboConnection, avec fake_rospy a la place de ROS et Gazebo.
+"""
+import unittest
+
+try:
+    from openai_ros import fake_rospy
+    world = fake_rospy.install()
+    from openai_ros.gazebo_connection import GazeboConnection
+    from rotors_comm.srv import StepWorld  # noqa: F401, utilisé par stepSim
+except ImportError as e:
+    raise unittest.SkipTest(f"ROS packages not available : {e}")
+
+
+class StepSimPauseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.gazebo = GazeboConnection(start_init_physics_parameters=False, reset_world_or_sim="NO_RESET_SIM")
+
+    def test_unpause_after_step_of_running_world(self):
+        self.gazebo.unpauseSim()
+        self.gazebo.stepSim(10)
+        self.assertTrue(self.gazebo.paused)
+
+        calls = world.calls.get("/gazebo/unpause_physics", 0)
+        self.gazebo.unpauseSim()
+        self.assertEqual(world.calls["/gazebo/unpause_physics"], calls + 1)
+        self.assertFalse(world.paused)
+
+
+if __name__ == "__main__":
+    unittest.main()
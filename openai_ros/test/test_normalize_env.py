@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+Statistiques courantes et NormalizeEnv sur un env minimal, sans ROS.
+"""
+import threading
+import unittest
+
+import gym
+import numpy as np
+from gym import spaces
+
+from openai_ros.normalize_env import NormalizeEnv, RunningMeanStd
+
+
+class ThreadAllreduce(object):
+    """Somme sur des workers simulés par des threads, comme MPI Allreduce (mpi_tools.mpi_sum64)"""
+
+    def __init__(self, workers):
+        self.barrier = threading.Barrier(workers)
+        self.values = {}
+
+    def __call__(self, x):
+        key = threading.get_ident()
+        self.values[key] = np.asarray(x, dtype=np.float64)
+        self.barrier.wait()
+        total = sum(self.values.values())
+        self.barrier.wait()
+        return total
+
+
+def sync_all(stats):
+    allreduce = ThreadAllreduce(len(stats))
+    threads = [threading.Thread(target=rms.sync, args=(allreduce,)) for rms in stats]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class ConstantEnv(gym.Env):
+    """Observation aleatoire de taille 3, reward constante"""
+    observation_space = spaces.Box(-np.inf, np.inf, (3,), np.float32)
+    action_space = spaces.Box(-1, 1, (3,), np.float32)
+
+    def __init__(self, reward=2.0):
+        self.reward = reward
+        self.rng = np.random.default_rng(0)
+
+    def reset(self):
+        return self.rng.standard_normal(3)
+
+    def step(self, action):
+        return self.rng.standard_normal(3), self.reward, False, {}
+
+
+class RunningMeanStdTest(unittest.TestCase):
+
+    def test_batched_updates_match_numpy(self):
+        x = np.random.default_rng(1).standard_normal((1000, 3)) * 2 + 1
+        rms = RunningMeanStd((3,), epsilon=0.0)
+        for chunk in np.array_split(x, 7):
+            rms.update(chunk)
+        np.testing.assert_allclose(rms.mean, x.mean(axis=0))
+        np.testing.assert_allclose(rms.var, x.var(axis=0))
+
+    def test_sync_merges_workers_exactly(self):
+        rng = np.random.default_rng(2)
+        workers = [RunningMeanStd((3,), epsilon=0.0) for _ in range(3)]
+        seen = []
+        for epoch in range(3):
+            for i, rms in enumerate(workers):
+                # Des workers qui voient des nombres et des distributions d'echantillons differents
+                x = rng.standard_normal((50 * (i + 1) + epoch, 3)) * (i + 1) + i
+                rms.update(x)
+                seen.append(x)
+            sync_all(workers)
+
+            x = np.concatenate(seen)
+            for rms in workers:
+                self.assertEqual(rms.count, len(x))
+                np.testing.assert_allclose(rms.mean, x.mean(axis=0))
+                np.testing.assert_allclose(rms.var, x.var(axis=0))
+
+    def test_sync_single_worker_keeps_statistics(self):
+        rms = RunningMeanStd((3,))
+        rms.update(np.random.default_rng(3).standard_normal((20, 3)))
+        mean, var = rms.mean.copy(), rms.var.copy()
+        rms.sync(lambda x: np.asarray(x, dtype=np.float64))
+        np.testing.assert_allclose(rms.mean, mean)
+        np.testing.assert_allclose(rms.var, var)
+
+    def test_starts_with_unit_variance(self):
+        np.testing.assert_allclose(RunningMeanStd((3,)).var, np.ones(3))
+
+
+class NormalizeEnvTest(unittest.TestCase):
+
+    def test_first_reward_not_clipped(self):
+        env = NormalizeEnv(ConstantEnv(reward=2.0))
+        env.reset()
+        _, reward, _, info = env.step(env.action_space.sample())
+        self.assertEqual(info["raw_reward"], 2.0)
+        self.assertLess(abs(reward), env.clip_reward)
+        self.assertAlmostEqual(reward, 2.0, places=3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+"""
+tune_physics sur DoubleBebop2TaskEnv, dont la GazeboConnection est créée sans start_init_physics_parameters,
+avec fake_rospy a la place de ROS et Gazebo.
+"""
+import unittest
+from unittest import mock
+
+try:
+    from openai_ros import fake_rospy
+    world = fake_rospy.install()
+    from openai_ros.task_envs.bebop2 import double_bebop2_task
+except ImportError as e:
+    raise unittest.SkipTest(f"ROS packages not available : {e}")
+
+
+class TunePhysicsTest(unittest.TestCase):
+
+    def test_tune_physics_without_init_physics_parameters(self):
+        with mock.patch.object(double_bebop2_task, "ROSLauncher", lambda **kwargs: None):
+            env = double_bebop2_task.DoubleBebop2TaskEnv(physics_tolerance=0.2)
+        self.assertFalse(env.gazebo.start_init_physics_parameters)
+
+        candidates = ((1000.0, 50), (0.0, 20))
+        best, results = env.tune_physics(tolerance=0.2, candidates=candidates)
+        self.assertIn(best, candidates)
+        self.assertEqual(len(results), len(candidates))
+
+        # Le reglage choisi est appliqué, les autres parametres de Gazebo sont gardés
+        self.assertEqual((world.max_update_rate, world.ode_config.sor_pgs_iters), best)
+        self.assertEqual(world.time_step, 0.01)
+        self.assertEqual(world.gravity.z, -9.81)
+
+
+if __name__ == "__main__":
+    unittest.main()
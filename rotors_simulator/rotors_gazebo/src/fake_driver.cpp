@@ -40,13 +40,14 @@ void LandCallback(const std_msgs::Empty& msg);
 void StopCallback(const std_msgs::Empty& msg);
 void MoveCallback(const geometry_msgs::Twist& bebop_twist_);
 void reset_pose_callback(const std_msgs::Empty& msg);
+void hover_callback(const std_msgs::Empty& msg);
 void StopMav();
 void ResetTwist(geometry_msgs::Twist& t);
 
 
 
 ros::Publisher trajectory_pub;
-ros::Subscriber odom_sub, joy_sub, joy_enable_sub, takeoff_sub, land_sub, stop_sub, move_sub, traj_sub, reset_pose_sub;
+ros::Subscriber odom_sub, joy_sub, joy_enable_sub, takeoff_sub, land_sub, stop_sub, move_sub, traj_sub, reset_pose_sub, hover_sub;
 nav_msgs::Odometry odom_msg;
 sensor_msgs::Joy joy_msg;
 geometry_msgs::Twist prev_bebop_twist_;
@@ -122,6 +123,7 @@ int main(int argc, char** argv) {
   stop_sub = nh.subscribe("reset", 10, &StopCallback);
   move_sub = nh.subscribe("cmd_vel", 10, &MoveCallback);
   reset_pose_sub = nh.subscribe("reset_pose", 10, &reset_pose_callback);
+  hover_sub = nh.subscribe("hover", 10, &hover_callback);
 
 
 
@@ -161,6 +163,23 @@ void reset_pose_callback(const std_msgs::Empty& msg){
   land = true;
 }
 
+void hover_callback(const std_msgs::Empty& msg){
+  // Utilisé apres un teleport (set_model_state) : le drone reprend la position courante comme consigne
+  // et passe directement en vol stationnaire, sans decollage
+
+  init_pose_set = false;
+  takeoff = false;
+  land = false;
+  emergency = false;
+  start = true;
+
+  ResetTwist(prev_bebop_twist_);
+  linear_x = 0.0;
+  linear_y = 0.0;
+  linear_z = 0.0;
+  angular_z = 0.0;
+}
+
 void StopCallback(const std_msgs::Empty& msg){
   emergency = true;
   takeoff = false;
@@ -0,0 +1,119 @@
+/*
+ * Relay between the training loop and the two drones.
+ *
+ * It packs the ground truth odometry of L_bebop2 and R_bebop2 into one fixed-size
+ * rotors_comm/PairState message, published at ~rate Hz (0: on every odometry update),
+ * and fans one rotors_comm/PairCommand message out to the two cmd_vel topics.
+ * The trainer then deserializes a single 28-double message instead of two full
+ * nav_msgs/Odometry messages with their covariances. Nothing is published until
+ * the odometry of both drones has been received.
+ */
+
+#include <geometry_msgs/Twist.h>
+#include <nav_msgs/Odometry.h>
+#include <ros/ros.h>
+#include <rotors_comm/PairCommand.h>
+#include <rotors_comm/PairState.h>
+
+static const int kRowSize = 14;
+
+class PairRelay {
+ public:
+  PairRelay(ros::NodeHandle& nh, ros::NodeHandle& private_nh) : updated_(false), received_{false, false} {
+    std::string L_odom, R_odom, L_cmd, R_cmd;
+    double rate;
+    private_nh.param<std::string>("L_odom", L_odom, "/L_bebop2/ground_truth/odometry");
+    private_nh.param<std::string>("R_odom", R_odom, "/R_bebop2/ground_truth/odometry");
+    private_nh.param<std::string>("L_cmd_vel", L_cmd, "/L_bebop2/cmd_vel");
+    private_nh.param<std::string>("R_cmd_vel", R_cmd, "/R_bebop2/cmd_vel");
+    private_nh.param("rate", rate, 100.0);
+
+    state_pub_ = nh.advertise<rotors_comm::PairState>("bebop2_pair/state", 1);
+    L_cmd_pub_ = nh.advertise<geometry_msgs::Twist>(L_cmd, 1);
+    R_cmd_pub_ = nh.advertise<geometry_msgs::Twist>(R_cmd, 1);
+
+    L_odom_sub_ = nh.subscribe<nav_msgs::Odometry>(L_odom, 1, boost::bind(&PairRelay::OdometryCallback, this, _1, 0));
+    R_odom_sub_ = nh.subscribe<nav_msgs::Odometry>(R_odom, 1, boost::bind(&PairRelay::OdometryCallback, this, _1, 1));
+    cmd_sub_ = nh.subscribe("bebop2_pair/cmd", 1, &PairRelay::CommandCallback, this);
+
+    publish_on_update_ = rate <= 0.0;
+    if (!publish_on_update_)
+      timer_ = nh.createTimer(ros::Duration(1.0 / rate), &PairRelay::TimerCallback, this);
+  }
+
+ private:
+  void OdometryCallback(const nav_msgs::OdometryConstPtr& msg, int index) {
+    double* row = &state_.state[index * kRowSize];
+    const geometry_msgs::Pose& pose = msg->pose.pose;
+    const geometry_msgs::Twist& twist = msg->twist.twist;
+
+    row[0] = msg->header.stamp.toSec();
+    row[1] = pose.position.x;
+    row[2] = pose.position.y;
+    row[3] = pose.position.z;
+    row[4] = pose.orientation.x;
+    row[5] = pose.orientation.y;
+    row[6] = pose.orientation.z;
+    row[7] = pose.orientation.w;
+    row[8] = twist.linear.x;
+    row[9] = twist.linear.y;
+    row[10] = twist.linear.z;
+    row[11] = twist.angular.x;
+    row[12] = twist.angular.y;
+    row[13] = twist.angular.z;
+    received_[index] = true;
+    updated_ = true;
+
+    if (publish_on_update_)
+      Publish();
+  }
+
+  void TimerCallback(const ros::TimerEvent&) {
+    Publish();
+  }
+
+  void Publish() {
+    // Nothing new since the last message, or one row still empty
+    if (!updated_ || !received_[0] || !received_[1])
+      return;
+    state_pub_.publish(state_);
+    updated_ = false;
+  }
+
+  static geometry_msgs::Twist ToTwist(const boost::array<double, 4>& cmd) {
+    geometry_msgs::Twist twist;
+    twist.linear.x = cmd[0];
+    twist.linear.y = cmd[1];
+    twist.linear.z = cmd[2];
+    twist.angular.z = cmd[3];
+    return twist;
+  }
+
+  void CommandCallback(const rotors_comm::PairCommandConstPtr& msg) {
+    if (msg->mask & rotors_comm::PairCommand::LEFT)
+      L_cmd_pub_.publish(ToTwist(msg->L));
+    if (msg->mask & rotors_comm::PairCommand::RIGHT)
+      R_cmd_pub_.publish(ToTwist(msg->R));
+  }
+
+  ros::Publisher state_pub_, L_cmd_pub_, R_cmd_pub_;
+  ros::Subscriber L_odom_sub_, R_odom_sub_, cmd_sub_;
+  ros::Timer timer_;
+
+  rotors_comm::PairState state_;
+  bool updated_;
+  bool received_[2];
+  bool publish_on_update_;
+};
+
+int main(int argc, char** argv) {
+  ros::init(argc, argv, "pair_relay");
+  ros::NodeHandle nh;
+  ros::NodeHandle private_nh("~");
+
+  PairRelay relay(nh, private_nh);
+  ROS_INFO("Started pair_relay.");
+
+  ros::spin();
+  return 0;
+}
@@ -0,0 +1,64 @@
+/*
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#ifndef ROTORS_GAZEBO_PLUGINS_GAZEBO_STEP_WORLD_PLUGIN_H
+#define ROTORS_GAZEBO_PLUGINS_GAZEBO_STEP_WORLD_PLUGIN_H
+
+#include <string>
+
+#include <gazebo/common/common.hh>
+#include <gazebo/gazebo.hh>
+#include <gazebo/physics/physics.hh>
+#include <ros/ros.h>
+#include <sdf/sdf.hh>
+
+#include "rotors_comm/StepWorld.h"
+#include "rotors_gazebo_plugins/common.h"
+
+namespace gazebo {
+
+static const std::string kDefaultStepWorldServiceName = "/gazebo/step_world";
+
+/// \brief    Lockstep plugin for Gazebo.
+/// \details  Advertises a service that runs an exact number of physics iterations on a paused
+///           world (World::Step) and only answers once they are done. This lets a training
+///           loop advance the simulation by a fixed amount of simulated time per action instead
+///           of unpausing, sleeping in wall time and pausing again.
+///           This plugin is ROS dependent, and is not built if NO_ROS=TRUE is provided to
+///           CMakeLists.txt.
+class GazeboStepWorldPlugin : public WorldPlugin {
+ public:
+  GazeboStepWorldPlugin()
+      : WorldPlugin(), node_handle_(kDefaultNamespace) {}
+  virtual ~GazeboStepWorldPlugin() {}
+
+ protected:
+
+  /// \brief Load the plugin.
+  /// \param[in] _parent Pointer to the world that loaded this plugin.
+  /// \param[in] _sdf SDF element that describes the plugin.
+  void Load(physics::WorldPtr _parent, sdf::ElementPtr _sdf);
+
+ private:
+  physics::WorldPtr world_;
+  ros::NodeHandle node_handle_;
+  ros::ServiceServer srv_;
+
+  bool ServiceCallback(rotors_comm::StepWorld::Request& req,
+                       rotors_comm::StepWorld::Response& res);
+};
+
+} // namespace gazebo
+
+#endif  // ROTORS_GAZEBO_PLUGINS_GAZEBO_STEP_WORLD_PLUGIN_H
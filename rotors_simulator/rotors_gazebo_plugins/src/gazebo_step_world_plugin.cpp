@@ -0,0 +1,54 @@
+/*
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include "rotors_gazebo_plugins/gazebo_step_world_plugin.h"
+
+namespace gazebo {
+
+void GazeboStepWorldPlugin::Load(physics::WorldPtr _parent,
+                                 sdf::ElementPtr _sdf) {
+  if (kPrintOnPluginLoad) {
+    gzdbg << __FUNCTION__ << "() called." << std::endl;
+  }
+
+  world_ = _parent;
+
+  std::string service_name = kDefaultStepWorldServiceName;
+  getSdfParam<std::string>(_sdf, "serviceName", service_name, service_name);
+
+  gzlog << "Advertising service: " << service_name << std::endl;
+  srv_ = node_handle_.advertiseService(
+      service_name, &GazeboStepWorldPlugin::ServiceCallback, this);
+}
+
+bool GazeboStepWorldPlugin::ServiceCallback(
+    rotors_comm::StepWorld::Request& req,
+    rotors_comm::StepWorld::Response& res) {
+  // Step() only runs iterations on a paused world.
+  if (!world_->IsPaused()) {
+    world_->SetPaused(true);
+  }
+
+  // Blocks until the world has run req.iterations physics updates.
+  world_->Step(req.iterations);
+
+  res.success = true;
+  res.world_iterations = world_->Iterations();
+  res.sim_time = world_->SimTime().Double();
+  return true;
+}
+
+GZ_REGISTER_WORLD_PLUGIN(GazeboStepWorldPlugin)
+
+} // namespace gazebo